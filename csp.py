@@ -1,37 +1,278 @@
 import os
+import contextlib
+import hashlib
+import heapq
+import json
+import pickle
 import itertools
+import multiprocessing
+import time
+import numpy as np
 import pandas as pd
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
 import random
+from bisect import bisect_left, insort
 
+import schema
+import scoring
 
-def load_csvs(upload_dir):
-    # Expect files in upload_dir: courses.csv, instructors.csv, rooms.csv, timeslots.csv, sections.csv
-    paths = {
-        'courses': f"{upload_dir}/courses.csv",
-        'instructors': f"{upload_dir}/instructors.csv",
-        'rooms': f"{upload_dir}/rooms.csv",
-        'timeslots': f"{upload_dir}/timeslots.csv",
-        'sections': f"{upload_dir}/sections.csv",
-    }
-    dfs = {}
-    for k, p in paths.items():
+
+# Position of each ID in an encoded (slot, instructor, room) value
+SLOT, INSTRUCTOR, ROOM = 0, 1, 2
+
+
+class ValueCatalog:
+    """
+    Interns timeslots, instructors and rooms to dense integer IDs.
+
+    Domains and solver assignments only hold these IDs; the catalog turns
+    them back into the original CSV values at the output boundary.
+    Duplicate values share one ID so they still conflict with each other.
+    """
+
+    def __init__(self, timeslots, instructors, rooms):
+        self.timeslots = list(dict.fromkeys(timeslots))
+        self.instructors = list(dict.fromkeys(instructors))
+        self.rooms = list(dict.fromkeys(rooms))
+        self.timeslot_ids = {t: i for i, t in enumerate(self.timeslots)}
+        self.instructor_ids = {x: i for i, x in enumerate(self.instructors)}
+        self.room_ids = {x: i for i, x in enumerate(self.rooms)}
+        self.days = list(dict.fromkeys(t[0] for t in self.timeslots))
+        day_ids = {d: i for i, d in enumerate(self.days)}
+        self.slot_days = np.array([day_ids[t[0]] for t in self.timeslots], dtype=np.int32)
+        # instructor x day "Not on" preferences, filled in by build_domains
+        self.unavailable = np.zeros((len(self.instructors), len(self.days)), dtype=bool)
+
+    def decode(self, value):
+        slot, instructor, room = value
+        return {
+            'timeslot': self.timeslots[slot],
+            'room': self.rooms[room],
+            'instructor': self.instructors[instructor]
+        }
+
+
+# Relaxation flags of the fallback ladder. A candidate tagged with a flag is
+# only usable once that relaxation is allowed; role mismatches are never tagged
+# because the role rule is never relaxed.
+RELAX_UNQUALIFIED = 1  # ignore QualifiedCourses and PreferredSlots
+RELAX_ROOM_TYPE = 2    # ignore room Type
+PERMISSIVE = RELAX_UNQUALIFIED | RELAX_ROOM_TYPE
+
+# Relaxations tried, in order, until a variable's domain is non-empty
+FALLBACK_LADDER = (
+    (0, None),
+    (RELAX_UNQUALIFIED, 'allow_unqualified_instructor'),
+    (RELAX_ROOM_TYPE, 'allow_room_type_mismatch'),
+    (PERMISSIVE, 'allow_unqualified_and_room_mismatch'),
+)
+
+
+class FactoredDomain:
+    """
+    Domain of one variable kept as three candidate sets instead of their product.
+
+    Values are (slot, instructor, room) ID tuples drawn from
+    slots x instructors x rooms, minus the (slot, instructor) pairs that
+    `available` marks False (instructor day preferences). Values are only
+    enumerated on demand, slot-major, so memory stays linear in the set sizes.
+
+    A tagged domain also carries the relaxation flags each instructor and room
+    candidate needs; view(relax) returns the plain domain allowed under relax.
+    """
+
+    __slots__ = ('slots', 'instructors', 'rooms', 'available', 'instructor_relax', 'room_relax')
+
+    def __init__(self, slots, instructors, rooms, available=None, instructor_relax=None, room_relax=None):
+        self.slots = np.asarray(slots, dtype=np.int32)
+        self.instructors = np.asarray(instructors, dtype=np.int32)
+        self.rooms = np.asarray(rooms, dtype=np.int32)
+        # bool (len(slots), len(instructors)) matrix; None means always available
+        self.available = available
+        self.instructor_relax = instructor_relax
+        self.room_relax = room_relax
+
+    def view(self, relax=0):
+        """The untagged domain allowed under the relaxation flags in relax"""
+        if self.instructor_relax is None:
+            return self
+        keep_instructors = (self.instructor_relax & ~relax) == 0
+        keep_rooms = (self.room_relax & ~relax) == 0
+        available = None
+        if self.available is not None and not relax & RELAX_UNQUALIFIED:
+            available = self.available[:, keep_instructors]
+            if available.all():
+                available = None
+        return FactoredDomain(self.slots, self.instructors[keep_instructors], self.rooms[keep_rooms], available)
+
+    def instructors_at(self, pos):
+        """Instructor IDs usable at the slot stored at position pos of self.slots"""
+        if self.available is None:
+            return self.instructors
+        return self.instructors[self.available[pos]]
+
+    def __len__(self):
+        if self.available is None:
+            return len(self.slots) * len(self.instructors) * len(self.rooms)
+        return int(self.available.sum()) * len(self.rooms)
+
+    def __contains__(self, value):
+        slot, instructor, room = value
+        pos = np.flatnonzero(self.slots == slot)
+        return len(pos) > 0 and instructor in self.instructors_at(pos[0]) and room in self.rooms
+
+    def __iter__(self):
+        rooms = self.rooms.tolist()
+        for pos, slot in enumerate(self.slots.tolist()):
+            for instructor in self.instructors_at(pos).tolist():
+                for room in rooms:
+                    yield (slot, instructor, room)
+
+
+class EncodedDomains(dict):
+    """
+    Mapping var -> FactoredDomain over catalog IDs.
+
+    Carries the ValueCatalog needed to decode the values, and the tagged
+    domains every fallback level is a view of.
+    """
+
+    def __init__(self, catalog, tagged=None):
+        super().__init__()
+        self.catalog = catalog
+        self.tagged = tagged if tagged is not None else {}
+
+    def relaxed(self, force_permissive=False):
+        """
+        Walk the fallback ladder over the tagged domains without rebuilding them.
+
+        Returns (domains, fallbacks_used): new EncodedDomains holding each
+        variable's first non-empty view, and var -> fallback labels applied.
+        """
+        ladder = ((PERMISSIVE, 'force_permissive_initial'),) if force_permissive else FALLBACK_LADDER
+        domains = EncodedDomains(self.catalog, self.tagged)
+        fallbacks_used = defaultdict(list)
+        for var, tagged in self.tagged.items():
+            for relax, label in ladder:
+                vals = tagged.view(relax)
+                if len(vals):
+                    if label:
+                        fallbacks_used[var].append(label)
+                    break
+            domains[var] = vals
+        return domains, fallbacks_used
+
+    def decoded(self, var, limit=None):
+        values = iter(self.get(var, empty_domain()))
+        if limit is not None:
+            values = itertools.islice(values, limit)
+        return [self.catalog.decode(v) for v in values]
+
+
+def empty_domain():
+    return FactoredDomain([], [], [])
+
+
+def pack_domains(variables, domains):
+    """
+    Flatten the FactoredDomains of variables into a few contiguous arrays.
+
+    Each factor is concatenated across variables with an offsets array
+    (variable k owns [offsets[k], offsets[k + 1])); availability matrices
+    and relaxation tags, where present, are flattened alongside. The result
+    is a dict name -> numpy array that can live in shared memory or a file;
+    unpack_domains rebuilds the domains as views into it without copying.
+    """
+    doms = [domains[v] for v in variables]
+    arrays = {}
+    for name in ('slots', 'instructors', 'rooms'):
+        parts = [getattr(d, name) for d in doms]
+        arrays[name] = np.concatenate(parts).astype(np.int32) if parts else np.zeros(0, dtype=np.int32)
+        arrays[name + '_offsets'] = np.concatenate([[0], np.cumsum([len(p) for p in parts], dtype=np.int64)])
+    available = [d.available.ravel() for d in doms if d.available is not None]
+    arrays['has_available'] = np.array([d.available is not None for d in doms], dtype=bool)
+    arrays['available'] = np.concatenate(available) if available else np.zeros(0, dtype=bool)
+    if doms and all(d.instructor_relax is not None for d in doms):
+        arrays['instructor_relax'] = np.concatenate([d.instructor_relax for d in doms]).astype(np.int8)
+        arrays['room_relax'] = np.concatenate([d.room_relax for d in doms]).astype(np.int8)
+    return arrays
+
+
+def array_layout(arrays):
+    """
+    Place pack_domains output in one buffer: returns (layout, size), layout
+    listing (name, dtype, shape, offset) with every array 8-byte aligned.
+    """
+    layout = []
+    size = 0
+    for name, array in arrays.items():
+        size = (size + 7) // 8 * 8
+        layout.append((name, array.dtype.str, array.shape, size))
+        size += array.nbytes
+    return layout, size
+
+
+def unpack_domains(variables, arrays):
+    """Rebuild var -> FactoredDomain from pack_domains output, as views into the arrays"""
+    tagged = 'instructor_relax' in arrays
+    offsets = {name: arrays[name + '_offsets'].tolist() for name in ('slots', 'instructors', 'rooms')}
+    has_available = arrays['has_available'].tolist()
+    domains = {}
+    avail_pos = 0
+    for k, v in enumerate(variables):
+        s0, s1 = offsets['slots'][k], offsets['slots'][k + 1]
+        i0, i1 = offsets['instructors'][k], offsets['instructors'][k + 1]
+        r0, r1 = offsets['rooms'][k], offsets['rooms'][k + 1]
+        available = None
+        if has_available[k]:
+            size = (s1 - s0) * (i1 - i0)
+            available = arrays['available'][avail_pos:avail_pos + size].reshape(s1 - s0, i1 - i0)
+            avail_pos += size
+        domains[v] = FactoredDomain(
+            arrays['slots'][s0:s1],
+            arrays['instructors'][i0:i1],
+            arrays['rooms'][r0:r1],
+            available,
+            arrays['instructor_relax'][i0:i1] if tagged else None,
+            arrays['room_relax'][r0:r1] if tagged else None,
+        )
+    return domains
+
+
+# Input files of an upload directory, in load_csvs order
+INPUT_NAMES = ('courses', 'instructors', 'rooms', 'timeslots', 'sections')
+
+
+def upload_paths(upload_dir):
+    """name -> path of each input file in upload_dir"""
+    paths = {}
+    for k in INPUT_NAMES:
         # First try upload_dir/<k>/<k>.csv (how uploads are stored), then upload_dir/<k>.csv
-        alt = os.path.join(upload_dir, k, f"{k}.csv")
-        p1 = p
-        p2 = alt
-        found = None
-        for candidate in (p2, p1):
-            try:
-                dfs[k] = pd.read_csv(candidate)
-                found = candidate
-                break
-            except FileNotFoundError:
-                continue
+        p1 = f"{upload_dir}/{k}.csv"
+        p2 = os.path.join(upload_dir, k, f"{k}.csv")
+        found = next((candidate for candidate in (p2, p1) if os.path.isfile(candidate)), None)
         if found is None:
             raise FileNotFoundError(f"Missing required upload: {k} (tried {p2} and {p1})")
-    return dfs['courses'], dfs['instructors'], dfs['rooms'], dfs['timeslots'], dfs['sections']
+        paths[k] = found
+    return paths
+
 
+def input_digests(upload_dir):
+    """name -> content hash of each input file of upload_dir"""
+    digests = {}
+    for name, path in upload_paths(upload_dir).items():
+        with open(path, 'rb') as f:
+            digests[name] = hashlib.sha1(f.read()).hexdigest()
+    return digests
+
+
+def load_csvs(upload_dir):
+    # Expect files in upload_dir: courses.csv, instructors.csv, rooms.csv, timeslots.csv, sections.csv
+    # Typed and validated per schema.SCHEMAS; frames stored at upload are used as they are
+    paths = upload_paths(upload_dir)
+    return tuple(schema.load_input(paths[k], k) for k in INPUT_NAMES)
 
 
 def parse_qualified_courses(val):
@@ -45,71 +286,151 @@ def parse_qualified_courses(val):
     return []
 
 
-def can_assign_course_to_section(course_id, section_id, course_year, is_shared=False):
+# Departments a shared year-3 course is taught to
+SHARED_DEPARTMENTS = ('AID', 'BIF', 'CSC', 'CNC')
+
+
+def parse_section_ids(section_ids):
     """
-    Check if a course can be assigned to a section based on year and department rules.
-    
-    Rules:
-    - For years 1-2: section format is "year/number" (e.g., "1/5", "2/3")
-        Course is assigned if section year matches course year
-    - For years 3-4: section format is "year/department/number" (e.g., "3/CNC/1", "4/AID/2")
-    Course is assigned if:
-        1. Section year matches course year AND
-        2. If is_shared=True (3rd year only): assign to all departments (AID, BIF, CSC, CNC)
-        3. If is_shared=False: Course department (first 3 letters) matches section department
-    
-    Args:
-        course_id: Course identifier (e.g., "CSC111", "AID321")
-        section_id: Section identifier (e.g., "1/5", "3/CNC/1", "4/AID/2")
-        course_year: Year level of the course (1, 2, 3, or 4)
-        is_shared: Whether the course is shared across departments (year 3 only)
-    
-    Returns:
-        bool: True if course can be assigned to this section
+    Split SectionIDs into year and department columns, all at once.
+
+    Years 1-2 use "year/number" (e.g. "1/5"), years 3-4
+    "year/department/number" (e.g. "3/CNC/1"). Returns a DataFrame with
+    'section' (the ID as a string), 'year' (float, NaN when the ID has no
+    "/" or a non-integer year) and 'dept' (the upper-cased second part).
+    """
+    sections = pd.Series(section_ids).astype(str).reset_index(drop=True)
+    parts = sections.str.split('/')
+    head = parts.str[0].str.strip()
+    parsed = sections.str.contains('/', regex=False) & head.str.fullmatch(r'[+-]?\d+')
+    return pd.DataFrame({
+        'section': sections,
+        'year': pd.to_numeric(head.where(parsed), errors='coerce').astype(float),
+        'dept': parts.str[1].fillna('').str.strip().str.upper(),
+    })
+
+
+def match_sections(courses, sections):
+    """
+    Sections each course is taught to: {course_id: [SectionIDs in input order]}.
+
+    courses is a DataFrame of 'course', 'year' and 'shared' (bool), sections
+    the output of parse_section_ids. A course takes the sections of its year:
+    all of them in years 1-2 (and any other year outside 3-4), those of
+    SHARED_DEPARTMENTS if it is a shared year-3 course, and otherwise those
+    of its own department (the first 3 letters of its ID). Sections whose
+    ID does not parse go to every course.
+    """
+    year = courses['year'].map(lambda y: np.nan if isinstance(y, str) else y)
+    courses = courses.assign(order=np.arange(len(courses)), year=pd.to_numeric(year, errors='coerce').astype(float))
+    ids = courses['course'].astype(str)
+    courses['dept'] = ids.str[:3].str.upper().where(ids.str.len() >= 3, '')
+    sections = sections.assign(pos=np.arange(len(sections)))
+    parsed = sections[sections['year'].notna()]
+
+    by_dept = courses['year'].isin((3, 4))
+    shared = by_dept & (courses['year'] == 3) & courses['shared'].astype(bool)
+    courses['dept'] = [list(SHARED_DEPARTMENTS) if s else d for d, s in zip(courses['dept'], shared)]
+    matches = pd.concat([
+        courses[~by_dept].drop(columns='dept').merge(parsed, on='year'),
+        courses[by_dept].explode('dept').merge(parsed, on=['year', 'dept']),
+        courses.drop(columns=['year', 'dept']).merge(sections[sections['year'].isna()], how='cross'),
+    ])
+    matches = matches.sort_values(['order', 'pos'], kind='stable')
+    return {course: list(group) for course, group in matches.groupby('course', sort=False)['section']}
+
+
+# Session types a course-group variable can have, in eligibility-matrix row order
+SESSION_TYPES = ('Lecture', 'Lab', 'TUT')
+
+
+class EligibilityMatrices:
+    """
+    Boolean eligibility matrices computed once per run from the input frames.
+
+    Rows of the instructor and room matrices follow the rows of
+    instructors_df and rooms_df; `instructor_ids` / `room_ids` map those rows
+    to catalog IDs (several rows may share one ID).
+
+    - qualified[c, i]: instructor i may teach course c (listed, or lists no courses)
+    - assistant_mismatch[s, i] / professor_mismatch[s, i]: the hard role rule
+      rejects instructor i for session type s
+    - room_ok[s, r]: room r's Type suits session type s
+    - unavailable[i, d]: instructor i asked "Not on" catalog day d
     """
-    if not section_id or '/' not in str(section_id):
-        return True  # If no proper section format, allow assignment
-    
-    parts = str(section_id).split('/')
-    if len(parts) < 2:
-        return True
-    
-    section_year_str = parts[0].strip()
-    # For years 3-4: extract department from 2nd part (e.g., "3/CNC/1" -> "CNC")
-    # For years 1-2: use 2nd part directly (e.g., "1/5" -> "5")
-    section_right = parts[1].strip() if len(parts) >= 2 else ""
-    
-    try:
-        section_year = int(section_year_str)
-    except ValueError:
-        return True  # If section year is not a number, allow assignment
-    
-    # Check if course year matches section year
-    if course_year != section_year:
-        return False
-    
-    # For years 1-2, only year matching is required
-    if course_year in [1, 2]:
-        return True
-    
-    # For year 3, check if course is shared
-    if course_year == 3 and is_shared:
-        # Shared courses in year 3 should be assigned to all departments
-        section_dept = section_right.upper()
-        # Check if section belongs to one of the main departments
-        return section_dept in ['AID', 'BIF', 'CSC', 'CNC']
-    
-    # For years 3-4 (non-shared or year 4), also check department matching
-    if course_year in [3, 4]:
-        # Extract department from course ID (first 3 letters)
-        course_dept = course_id[:3].upper() if len(course_id) >= 3 else ""
-        section_dept = section_right.upper()
-        
-        # Course department must match section department
-        return course_dept == section_dept
-    
-    return True
 
+    def __init__(self, courses_df, instructors_df, rooms_df, catalog):
+        instructors_df = instructors_df.reset_index(drop=True)
+        rooms_df = rooms_df.reset_index(drop=True)
+        n_instructors = len(instructors_df)
+
+        self.course_index = {c: k for k, c in enumerate(dict.fromkeys(courses_df['CourseID']))}
+        self.instructor_ids = np.array([catalog.instructor_ids[x] for x in instructors_df['_id']], dtype=np.int32)
+        self.room_ids = np.array([catalog.room_ids[x] for x in rooms_df['RoomID']], dtype=np.int32)
+
+        # course x instructor qualification
+        quals = instructors_df['_quals']
+        self.qualified = np.tile((quals.str.len() == 0).to_numpy(), (len(self.course_index), 1))
+        listed = quals.explode().dropna()
+        listed = listed[listed.isin(self.course_index.keys())]
+        self.qualified[listed.map(self.course_index).to_numpy(dtype=np.intp), listed.index.to_numpy()] = True
+
+        # session type x instructor role rule
+        if 'Role' in instructors_df.columns:
+            roles = instructors_df['Role'].astype(object).fillna('').astype(str).str.lower()
+        else:
+            roles = pd.Series([''] * n_instructors, dtype=object)
+        assistant = roles.str.contains('assistant', regex=False).to_numpy()
+        professor = roles.str.contains('professor', regex=False).to_numpy() & ~assistant
+        lab_or_tut = np.array([s in ('Lab', 'TUT') for s in SESSION_TYPES])
+        self.assistant_mismatch = np.outer(~lab_or_tut, assistant)
+        self.professor_mismatch = np.outer(lab_or_tut, professor)
+
+        # session type x room type
+        rtypes = rooms_df['Type'].astype(object).fillna('Lecture').astype(str).str.lower()
+        is_lab_room = rtypes.str.startswith('lab').to_numpy()
+        is_tut_room = (rtypes == 'tut').to_numpy()
+        self.room_ok = np.vstack([
+            ~(is_lab_room | is_tut_room),  # Lecture
+            is_lab_room,                   # Lab
+            is_tut_room,                   # TUT
+        ])
+
+        # instructor x day availability ("Not on <Day>" in PreferredSlots)
+        self.unavailable = np.zeros((n_instructors, len(catalog.days)), dtype=bool)
+        if 'PreferredSlots' in instructors_df.columns:
+            prefs = instructors_df['PreferredSlots']
+            prefs = prefs.where(prefs.map(lambda x: isinstance(x, str)), '')
+            not_on = prefs.str.contains('Not on', regex=False).to_numpy()
+            for d, day in enumerate(catalog.days):
+                self.unavailable[:, d] = not_on & prefs.str.contains(str(day), regex=False).to_numpy()
+
+    def by_instructor_id(self, rows, available, relax):
+        """
+        Collapse per-row data to per catalog ID, IDs kept in first-row order.
+
+        available (rows x slots) becomes (slots x IDs), an ID being available
+        when any of its rows is; relax (per row) becomes the weakest flags of
+        the ID's rows.
+        """
+        ids, first, inverse = np.unique(self.instructor_ids[rows], return_index=True, return_inverse=True)
+        order = np.argsort(first, kind='stable')
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        inverse = rank[inverse.ravel()]
+        collapsed = np.zeros((available.shape[1], len(ids)), dtype=bool)
+        np.logical_or.at(collapsed.T, inverse, available)
+        id_relax = np.full(len(ids), np.iinfo(np.int8).max, dtype=np.int8)
+        np.minimum.at(id_relax, inverse, relax)
+        return ids[order], collapsed, id_relax
+
+    def by_room_id(self, relax):
+        """Collapse per-row room relax flags to (IDs, weakest flags), IDs in first-row order"""
+        ids, first, inverse = np.unique(self.room_ids, return_index=True, return_inverse=True)
+        id_relax = np.full(len(ids), np.iinfo(np.int8).max, dtype=np.int8)
+        np.minimum.at(id_relax, inverse.ravel(), relax)
+        order = np.argsort(first, kind='stable')
+        return ids[order], id_relax[order]
 
 
 def create_section_groups(sections, session_type='Lecture'):
@@ -181,27 +502,18 @@ def build_domains(courses_df, instructors_df, rooms_df, timeslots_df, sections_d
         # Smart assignment of courses to sections based on year and department rules
         print('[csp] CourseID not found in sections - building course-to-sections mapping with grouping')
         
-        for _, course in courses_df.iterrows():
-            course_id = course['CourseID']
-            course_year = course_years.get(course_id)
-            
-            if course_year is None:
-                continue
-            
-            # Check if course is shared (only for year 3)
-            is_shared = False
-            if course_year == 3 and 'Shared' in course:
-                shared_val = str(course.get('Shared', '')).strip().lower()
-                is_shared = shared_val == 'yes'
-            
+        shared_column = 'Shared' in courses_df.columns
+        with_year = [c for c, y in course_years.items() if y is not None]
+        courses = pd.DataFrame({
+            'course': with_year,
+            'year': pd.Series([course_years[c] for c in with_year], dtype=object),
+            'shared': [shared_column and str(course_shared.get(c, '')).strip().lower() == 'yes' for c in with_year],
+        })
+        sections_by_course = match_sections(courses, parse_section_ids(sections_df['SectionID']))
+        
+        for course_id in with_year:
             # Find ALL matching sections for this course
-            matching_sections = []
-            for _, sec in sections_df.iterrows():
-                section_id = str(sec['SectionID'])
-                
-                # Check if this course can be assigned to this section
-                if can_assign_course_to_section(course_id, section_id, course_year, is_shared):
-                    matching_sections.append(section_id)
+            matching_sections = sections_by_course.get(course_id, [])
             
             # Group the sections differently for each session type
             if matching_sections:
@@ -230,47 +542,51 @@ def build_domains(courses_df, instructors_df, rooms_df, timeslots_df, sections_d
                 total_tut_groups = sum([len(course_to_section_groups[c].get('TUT', [])) for c in year_courses])
                 print(f'[csp]   Year {int(year)}: {len(year_courses)} courses → Lectures: {total_lecture_groups} groups, Labs: {total_lab_groups} groups, TUTs: {total_tut_groups} groups')
 
-    timeslots = []
-    timeslots_45 = []  # Store 45-minute timeslots separately
-    timeslots_90 = []  # Store 90-minute timeslots separately
-    
-    for idx, r in timeslots_df.iterrows():
-        slot = (r['Day'], r['StartTime'], r['EndTime'])
-        timeslots.append(slot)
-        
-        # Categorize by duration if Duration column exists
-        if 'Duration' in timeslots_df.columns:
-            duration = r.get('Duration', 90)
-            if duration == 45:
-                timeslots_45.append(slot)
-            elif duration == 90:
-                timeslots_90.append(slot)
-        else:
-            # If no Duration column, assume all are 90 minutes
-            timeslots_90.append(slot)
-
-    rooms = list(rooms_df.to_dict('records'))
-    instructors = list(instructors_df.to_dict('records'))
+    timeslots = list(zip(timeslots_df['Day'], timeslots_df['StartTime'], timeslots_df['EndTime']))
+    # Categorize by duration if Duration column exists
+    if 'Duration' in timeslots_df.columns:
+        timeslots_45 = [slot for slot, duration in zip(timeslots, timeslots_df['Duration']) if duration == 45]
+        timeslots_90 = [slot for slot, duration in zip(timeslots, timeslots_df['Duration']) if duration == 90]
+    else:
+        timeslots_45 = []
+        # If no Duration column, assume all are 90 minutes
+        timeslots_90 = list(timeslots)
 
     if len(timeslots) == 0:
         raise ValueError('timeslots.csv contains no rows')
-    if len(rooms) == 0:
+    if len(rooms_df) == 0:
         raise ValueError('rooms.csv contains no rows')
-    if len(instructors) == 0:
+    if len(instructors_df) == 0:
         raise ValueError('instructors.csv contains no rows')
 
+    # Intern every timeslot, instructor and room once; domains only hold the IDs
+    if 'InstructorID' in instructors_df.columns:
+        instructors_df['_id'] = instructors_df['InstructorID']
+    else:
+        instructors_df['_id'] = instructors_df.get('Name')
+    catalog = ValueCatalog(timeslots, list(instructors_df['_id']), list(rooms_df['RoomID']))
+
+    # Every eligibility test below is a row lookup into these precomputed matrices
+    eligibility = EligibilityMatrices(courses_df, instructors_df, rooms_df, catalog)
+    catalog.unavailable[:] = True
+    np.logical_and.at(catalog.unavailable, eligibility.instructor_ids, eligibility.unavailable)
+    slot_ids_all = np.array(list(dict.fromkeys(catalog.timeslot_ids[t] for t in timeslots)), dtype=np.int32)
+    slot_ids_45 = np.array(list(dict.fromkeys(catalog.timeslot_ids[t] for t in timeslots_45)), dtype=np.int32)
+    slot_ids_90 = np.array(list(dict.fromkeys(catalog.timeslot_ids[t] for t in timeslots_90)), dtype=np.int32)
+    session_rooms = {
+        session_type: eligibility.by_room_id(np.where(eligibility.room_ok[k], 0, RELAX_ROOM_TYPE).astype(np.int8))
+        for k, session_type in enumerate(SESSION_TYPES)
+    }
+
     # NEW APPROACH: Create variables for COURSE-GROUP pairs
     # Each group of sections shares the same timeslot
     variables = []
-    domains = {}
+    domains = EncodedDomains(catalog)
     meta = {}
     rejection_reasons = defaultdict(lambda: defaultdict(int))
-    fallbacks_used = defaultdict(list)
     
     # Process each course and its section groups
-    for _, course in courses_df.iterrows():
-        course_id = course['CourseID']
-        course_year = course_years.get(course_id, None)
+    for course_id in courses_df['CourseID']:
         
         # Skip courses without matching section groups
         if course_id not in course_to_section_groups or not course_to_section_groups[course_id]:
@@ -286,119 +602,72 @@ def build_domains(courses_df, instructors_df, rooms_df, timeslots_df, sections_d
                 var = f"{course_id}::G{group_idx}::{session_type}"
                 variables.append(var)
 
-                def generate_vals(allow_unqualified=False, allow_room_mismatch=False, allow_role_mismatch=False):
-                    vals_local = []
-                    
-                    # Pre-filter instructors to avoid repeated checks
-                    valid_instructors = []
-                    for instr in instructors:
-                        # Check qualifications
-                        quals = instr.get('_quals', [])
-                        if not allow_unqualified and quals and course_id not in quals:
-                            rejection_reasons[var]['unqualified_instructor'] += 1
-                            continue
-                        
-                        # Check role-based assignment
-                        instr_role = str(instr.get('Role', '')).lower()
-                        is_lab_or_tut = ('lab' in session_type.lower() or 'tut' in session_type.lower())
-                        
-                        if not allow_role_mismatch and instr_role:
-                            # Assistant Professor should only teach labs and tutorials
-                            if 'assistant' in instr_role and not is_lab_or_tut:
-                                rejection_reasons[var]['role_mismatch_assistant_to_lecture'] += 1
-                                continue
-                            # Professor should only teach lectures
-                            elif 'professor' in instr_role and 'assistant' not in instr_role and is_lab_or_tut:
-                                rejection_reasons[var]['role_mismatch_professor_to_lab_or_tut'] += 1
-                                continue
-                        
-                        valid_instructors.append(instr)
-                    
-                    # Pre-filter rooms
-                    valid_rooms = []
-                    for room in rooms:
-                        rtype = room.get('Type', 'Lecture')
-                        
-                        # Match room type to session type
-                        if session_type.lower() == 'lab' and not rtype.lower().startswith('lab'):
-                            if not allow_room_mismatch:
-                                rejection_reasons[var]['room_type_mismatch'] += 1
-                                continue
-                        elif session_type.lower() == 'lecture' and (rtype.lower().startswith('lab') or rtype.lower() == 'tut'):
-                            if not allow_room_mismatch:
-                                rejection_reasons[var]['room_type_mismatch'] += 1
-                                continue
-                        elif session_type.lower() == 'tut' and rtype.lower() != 'tut':
-                            if not allow_room_mismatch:
-                                rejection_reasons[var]['room_type_mismatch'] += 1
-                                continue
-                        
-                        valid_rooms.append(room)
-                    
-                    # Filter timeslots based on session type and course type
-                    # Rule: If course has "Lecture and Lab and TUT" → TUT uses 45-min slots
-                    #       If course has "Lecture and TUT" (no Lab) → TUT uses 90-min slots
-                    ctype_lower = ctype.lower() if isinstance(ctype, str) else 'lecture'
-                    
-                    if session_type.lower() == 'tut':
-                        # Check if course has both Lab and TUT
-                        has_lab = 'lab' in ctype_lower
-                        has_lecture = 'lecture' in ctype_lower
-                        
-                        if has_lab and has_lecture:
-                            # "Lecture and Lab and TUT" → use 45-minute slots
-                            valid_timeslots = timeslots_45 if timeslots_45 else timeslots
-                        else:
-                            # "Lecture and TUT" (no Lab) → use 90-minute slots
-                            valid_timeslots = timeslots_90 if timeslots_90 else timeslots
+                course_row = eligibility.course_index[course_id]
+                session_row = SESSION_TYPES.index(session_type)
+
+                # Filter timeslots based on session type and course type
+                # Rule: If course has "Lecture and Lab and TUT" → TUT uses 45-min slots
+                #       If course has "Lecture and TUT" (no Lab) → TUT uses 90-min slots
+                ctype_lower = ctype.lower() if isinstance(ctype, str) else 'lecture'
+
+                if session_type.lower() == 'tut':
+                    # Check if course has both Lab and TUT
+                    has_lab = 'lab' in ctype_lower
+                    has_lecture = 'lecture' in ctype_lower
+
+                    if has_lab and has_lecture:
+                        # "Lecture and Lab and TUT" → use 45-minute slots
+                        valid_slot_ids = slot_ids_45 if len(slot_ids_45) else slot_ids_all
                     else:
-                        # Lecture and Lab always use 90-minute slots
-                        valid_timeslots = timeslots_90 if timeslots_90 else timeslots
-                    
-                    # Now generate combinations with pre-filtered lists
-                    for t in valid_timeslots:
-                        day = t[0]
-                        for instr in valid_instructors:
-                            # Check instructor day preferences
-                            pref_slots = instr.get('PreferredSlots', '')
-                            if pref_slots and isinstance(pref_slots, str):
-                                if 'Not on' in pref_slots and day in pref_slots:
-                                    if not allow_unqualified:  # treat as similar constraint level
-                                        rejection_reasons[var]['instructor_unavailable'] += 1
-                                        continue
-                            
-                            instr_id = instr['InstructorID'] if 'InstructorID' in instr else instr.get('Name')
-                            
-                            for room in valid_rooms:
-                                vals_local.append({
-                                    'timeslot': t,
-                                    'room': room['RoomID'],
-                                    'instructor': instr_id
-                                })
-                    
-                    return vals_local
-
-                if force_permissive:
-                    # Even in permissive mode, NEVER allow role mismatch (hard constraint)
-                    vals = generate_vals(allow_unqualified=True, allow_room_mismatch=True, allow_role_mismatch=False)
-                    if vals:
-                        fallbacks_used[var].append('force_permissive_initial')
+                        # "Lecture and TUT" (no Lab) → use 90-minute slots
+                        valid_slot_ids = slot_ids_90 if len(slot_ids_90) else slot_ids_all
                 else:
-                    vals = generate_vals(allow_unqualified=False, allow_room_mismatch=False, allow_role_mismatch=False)
-                if not vals:
-                    vals = generate_vals(allow_unqualified=True, allow_room_mismatch=False, allow_role_mismatch=False)
-                    if vals:
-                        fallbacks_used[var].append('allow_unqualified_instructor')
-                if not vals:
-                    vals = generate_vals(allow_unqualified=False, allow_room_mismatch=True, allow_role_mismatch=False)
-                    if vals:
-                        fallbacks_used[var].append('allow_room_type_mismatch')
-                if not vals:
-                    vals = generate_vals(allow_unqualified=True, allow_room_mismatch=True, allow_role_mismatch=False)
-                    if vals:
-                        fallbacks_used[var].append('allow_unqualified_and_room_mismatch')
-                
-                domains[var] = vals
+                    # Lecture and Lab always use 90-minute slots
+                    valid_slot_ids = slot_ids_90 if len(slot_ids_90) else slot_ids_all
+
+                # One pass per variable: every candidate is tagged with the relaxation
+                # flags it needs, so each fallback level is just a view of this domain.
+                # Rejection counts are sums over the strict-level masks.
+                reasons = rejection_reasons[var]
+
+                # Instructors: the role rule is hard, qualification is relaxable
+                # (Assistant Professor only teaches labs and tutorials,
+                # Professor only teaches lectures)
+                qualified = eligibility.qualified[course_row]
+                if not qualified.all():
+                    reasons['unqualified_instructor'] += int((~qualified).sum())
+                role_ok = np.ones_like(qualified)
+                for reason, mismatch in (('role_mismatch_assistant_to_lecture', eligibility.assistant_mismatch[session_row]),
+                                         ('role_mismatch_professor_to_lab_or_tut', eligibility.professor_mismatch[session_row])):
+                    rejected = qualified & role_ok & mismatch
+                    if rejected.any():
+                        reasons[reason] += int(rejected.sum())
+                    role_ok &= ~mismatch
+                instr_rows = np.flatnonzero(role_ok)
+                row_relax = np.where(qualified[instr_rows], 0, RELAX_UNQUALIFIED).astype(np.int8)
+
+                # Instructor day preferences only apply at the strict qualification level
+                row_available = ~eligibility.unavailable[instr_rows][:, catalog.slot_days[valid_slot_ids]]
+                row_available[row_relax != 0] = False
+                unavailable_count = int((row_relax == 0).sum()) * len(valid_slot_ids) - int(row_available.sum())
+                if unavailable_count:
+                    reasons['instructor_unavailable'] += unavailable_count
+                instr_ids, available, instructor_relax = eligibility.by_instructor_id(instr_rows, row_available, row_relax)
+
+                # Rooms: type must match the session type unless relaxed
+                room_ok = eligibility.room_ok[session_row]
+                if not room_ok.all():
+                    reasons['room_type_mismatch'] += int((~room_ok).sum())
+                room_ids, room_relax = session_rooms[session_type]
+
+                domains.tagged[var] = FactoredDomain(
+                    valid_slot_ids,
+                    instr_ids,
+                    room_ids,
+                    available,
+                    instructor_relax,
+                    room_relax
+                )
                 meta[var] = {
                     'course': course_id,
                     'group_index': group_idx,
@@ -406,6 +675,10 @@ def build_domains(courses_df, instructors_df, rooms_df, timeslots_df, sections_d
                     'type': ctype
                 }
 
+    # Every fallback level is a view of the tagged domains; relaxed() picks
+    # each variable's first non-empty one
+    domains, fallbacks_used = domains.relaxed(force_permissive=force_permissive)
+
     for v in variables:
         meta[v]['rejection_reasons'] = dict(rejection_reasons.get(v, {}))
         meta[v]['fallbacks'] = fallbacks_used.get(v, [])
@@ -414,187 +687,1741 @@ def build_domains(courses_df, instructors_df, rooms_df, timeslots_df, sections_d
     return variables, domains, meta, course_to_section_groups
 
 
+# Parsed and encoded inputs, cached by input content in the upload directory
+MODEL_CACHE_DIR = '.model_cache'
+MODEL_CACHE_ENTRIES = 8
+# Bump whenever build_domains, the input schema or the file layout changes, so older models are rebuilt
+MODEL_CACHE_VERSION = 2
 
-def forward_checking_search(variables, domains, meta):
-    assignment = {}
-    
-    # Pre-compute constraint neighbors - variables that share any timeslot
-    var_timeslots = {}
-    for v in variables:
-        ts_set = set()
-        for val in domains[v]:
-            ts_set.add(val['timeslot'])
-        var_timeslots[v] = ts_set
+
+def model_key(digests):
+    """Cache key of the inputs with these input_digests"""
+    text = json.dumps([MODEL_CACHE_VERSION] + [digests[k] for k in INPUT_NAMES])
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def save_model(path, variables, domains, meta, course_to_section_groups, frames):
+    """
+    Write a model in one file: the length of a pickled header (frames,
+    variables, meta, section groups, catalog and array layout), the header,
+    then the tagged domains packed by pack_domains, 8-byte aligned so that
+    read_model can map them in place.
+    """
+    catalog = domains.catalog
+    arrays = pack_domains(variables, domains.tagged)
+    layout, size = array_layout(arrays)
+    header = pickle.dumps(dict(variables=variables, meta=meta, course_to_section_groups=course_to_section_groups,
+                               frames=frames, layout=layout,
+                               catalog=(catalog.timeslots, catalog.instructors, catalog.rooms, catalog.unavailable)),
+                          protocol=pickle.HIGHEST_PROTOCOL)
+    start = (8 + len(header) + 7) // 8 * 8
+    partial = f"{path}.{os.getpid()}.tmp"
+    with open(partial, 'wb') as f:
+        f.write(len(header).to_bytes(8, 'little'))
+        f.write(header)
+        for name, dtype, shape, offset in layout:
+            f.seek(start + offset)
+            f.write(arrays[name].tobytes())
+        f.truncate(start + size)
+    os.replace(partial, path)
+
+
+def read_model(path):
+    """The model written by save_model, with its domains memory-mapped from the file"""
+    with open(path, 'rb') as f:
+        length = int.from_bytes(f.read(8), 'little')
+        if length > os.fstat(f.fileno()).st_size - 8:
+            raise ValueError(f'header of {length} bytes runs past the end of the file')
+        header = pickle.loads(f.read(length))
+    start = (8 + length + 7) // 8 * 8
+    mapped = np.memmap(path, dtype=np.uint8, mode='r')
+    end = max((offset + np.dtype(dtype).itemsize * int(np.prod(shape)) for _, dtype, shape, offset in header['layout']),
+              default=0)
+    if len(mapped) < start + end:
+        raise ValueError(f'file is truncated: {len(mapped)} of {start + end} bytes')
+    arrays = {name: np.ndarray(shape, dtype=dtype, buffer=mapped, offset=start + offset)
+              for name, dtype, shape, offset in header['layout']}
+    variables = header['variables']
+    timeslots, instructors, rooms, unavailable = header['catalog']
+    catalog = ValueCatalog(timeslots, instructors, rooms)
+    catalog.unavailable = unavailable
+    tagged = EncodedDomains(catalog, unpack_domains(variables, arrays))
+    # fallbacks are already recorded in meta
+    domains, _ = tagged.relaxed()
+    return variables, domains, header['meta'], header['course_to_section_groups'], header['frames']
+
+
+def load_model(upload_dir, cache=True):
+    """
+    load_csvs + build_domains: returns (variables, domains, meta,
+    course_to_section_groups, frames), frames mapping input names to their
+    DataFrames.
+
+    With cache, the model is stored in MODEL_CACHE_DIR under a hash of the
+    five input files, and later calls on the same files read it back
+    instead of parsing the CSVs and building the domains again. Only the
+    MODEL_CACHE_ENTRIES most recently used models are kept.
+    """
+    if cache:
+        cache_dir = os.path.join(upload_dir, MODEL_CACHE_DIR)
+        path = os.path.join(cache_dir, model_key(input_digests(upload_dir)) + '.model')
+        try:
+            model = read_model(path)
+            os.utime(path)
+            print(f'[csp] Model cache: reusing {len(model[0])} variables built from the same inputs')
+            return model
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, EOFError, KeyError, AttributeError, pickle.UnpicklingError) as e:
+            print(f'[csp] Model cache: ignoring unreadable {path}: {e}')
+    frames = dict(zip(INPUT_NAMES, load_csvs(upload_dir)))
+    model = build_domains(*frames.values()) + (frames,)
+    if cache:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            save_model(path, *model)
+            prune_cache(cache_dir, '.model', keep=MODEL_CACHE_ENTRIES)
+        except (OSError, pickle.PicklingError) as e:
+            print(f'[csp] Model cache: could not store the model: {e}')
+    return model
+
+
+def prune_cache(cache_dir, suffix='', keep=None, max_bytes=None):
+    """
+    Evict the least recently used files ending in suffix from cache_dir
+    until at most `keep` of them, taking at most max_bytes, are left. The
+    most recent file is always kept.
+    """
+    entries = [e for e in os.scandir(cache_dir) if e.name.endswith(suffix) and not e.name.endswith('.tmp')]
+    entries.sort(key=lambda e: e.stat().st_mtime, reverse=True)
+    total = 0
+    for k, e in enumerate(entries):
+        total += e.stat().st_size
+        if k and ((keep is not None and k >= keep) or (max_bytes is not None and total > max_bytes)):
+            try:
+                os.remove(e.path)
+            except OSError:
+                pass
+
+
+def cache_read(cache_dir, name):
+    """Contents of a cache file, marking it recently used; None when absent"""
+    path = os.path.join(cache_dir, name)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        os.utime(path)
+    except OSError:
+        return None
+    return data
+
+
+def cache_write(cache_dir, name, data, max_bytes=None):
+    """Store data as a cache file, then evict down to max_bytes (see prune_cache)"""
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, name)
+        partial = f"{path}.{os.getpid()}.tmp"
+        with open(partial, 'wb') as f:
+            f.write(data)
+        os.replace(partial, path)
+        prune_cache(cache_dir, max_bytes=max_bytes)
+    except OSError as e:
+        print(f'[csp] Cache: could not store {name}: {e}')
+
+
+# Complete timetables, cached by input content and solver options in the
+# upload directory, least recently used first out beyond SOLUTION_CACHE_BYTES
+SOLUTION_CACHE_DIR = '.solution_cache'
+SOLUTION_CACHE_BYTES = 64 * 1024 * 1024
+# Bump whenever the stored timetable changes shape; the pandas version that
+# pickled it is part of the key as well
+SOLUTION_CACHE_VERSION = 1
+
+
+def solution_key(digests, options):
+    """Cache key of a timetable of the inputs with these input_digests, solved with options"""
+    text = json.dumps([MODEL_CACHE_VERSION, SOLUTION_CACHE_VERSION, pd.__version__,
+                       [digests[k] for k in INPUT_NAMES], options], sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def hints_digest(hints):
+    """Content hash of the hints argument of generate_timetable_from_uploads"""
+    if hints is None:
+        return None
+    if isinstance(hints, str):
+        with open(hints, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    return hashlib.sha1(pd.DataFrame(hints).to_csv(index=False).encode()).hexdigest()
+
+
+
+# Longest conflict set the nogood store learns; longer ones rarely match again
+MAX_NOGOOD_LITERALS = 6
+
+# Propagation after each assignment: plain forward checking, or full arc consistency
+PROPAGATION_LEVELS = ('fc', 'ac3')
+
+# Variable selection: smallest domain then highest degree, or smallest
+# domain per failure-weighted degree (dom/wdeg)
+VARIABLE_ORDERINGS = ('mrv', 'domwdeg')
+
+# Value ordering: least loaded slots first, or least-constraining value
+# (fewest values removed from unassigned neighbors)
+VALUE_ORDERINGS = ('load', 'lcv')
+
+# Domains larger than this rank only a random sample of values by LCV
+LCV_SAMPLE = 64
+
+# Restart schedules: cutoffs (in failures) of successive runs, in units of restart_base
+RESTART_SCHEDULES = ('luby', 'geometric')
+GEOMETRIC_RESTART_FACTOR = 1.5
+
+
+def luby(i):
+    """The i-th term (from 1) of the Luby sequence 1, 1, 2, 1, 1, 2, 4, 1, ..."""
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+    if (1 << k) - 1 == i:
+        return 1 << (k - 1)
+    return luby(i - (1 << (k - 1)) + 1)
+
+
+def restart_cutoffs(schedule, base):
+    """Failure cutoffs of the runs of a restart schedule"""
+    for i in itertools.count(1):
+        if schedule == 'luby':
+            yield base * luby(i)
+        else:
+            yield int(base * GEOMETRIC_RESTART_FACTOR ** (i - 1))
+
+
+def bit_indexes(mask):
+    """Positions of the set bits of mask, ascending"""
+    found = []
+    while mask:
+        low = mask & -mask
+        found.append(low.bit_length() - 1)
+        mask ^= low
+    return found
+
+
+def group_symmetries(variables, domains, meta):
+    """
+    Detect interchangeable section groups.
+
+    Swapping the sections of two groups of one course and session (G0 and
+    G1 of CSC111 Lab, say) section by section is a symmetry of the problem
+    when every variable's sections map onto the sections of another variable
+    of the same course and session with the same domain: any timetable then
+    gives another one by exchanging their classes. For each such swap,
+    returns (v, w): the first variable the swap moves and its image, for
+    the lex-leader constraint slot(v) <= slot(w).
+    """
+    def session(v):
+        return v.split('::')[2]
     
-    constraint_neighbors = {}
+    by_sections = {(meta[v]['course'], session(v), frozenset(meta[v]['sections'])): v for v in variables}
+    groups = defaultdict(list)
     for v in variables:
-        neighbors = []
-        v_ts = var_timeslots[v]
-        for other in variables:
-            if other != v and v_ts & var_timeslots[other]:
-                neighbors.append(other)
-        constraint_neighbors[v] = neighbors
-    2
-    # Cache for faster lookups
-    assigned_by_timeslot = {}  # timeslot -> {instructor: set(), room: set(), sections: set()}
-    local_domains = {v: list(domains[v]) for v in variables}
+        groups[(meta[v]['course'], session(v))].append(v)
     
-    print(f"[csp] Constraint graph built - avg neighbors: {sum(len(n) for n in constraint_neighbors.values())/len(constraint_neighbors):.1f}")
-
-    def consistent(var, val):
-        """Fast consistency check using cached timeslot assignments"""
-        ts = val['timeslot']
-        if ts not in assigned_by_timeslot:
+    def same_domain(a, b):
+        da, db = domains[a], domains[b]
+        if da is db:
             return True
-        
-        ts_data = assigned_by_timeslot[ts]
-        # Check for instructor, room, AND section conflicts
-        var_sections = set(meta[var]['sections'])
-        if val['instructor'] in ts_data['instructor']:
+        if not (np.array_equal(da.slots, db.slots) and np.array_equal(da.instructors, db.instructors)
+                and np.array_equal(da.rooms, db.rooms)):
             return False
-        if val['room'] in ts_data['room']:
+        if da.available is None or db.available is None:
+            return da.available is db.available
+        return np.array_equal(da.available, db.available)
+    
+    pairs = []
+    tried = set()
+    for members in groups.values():
+        for a, b in zip(members, members[1:]):
+            sa, sb = meta[a]['sections'], meta[b]['sections']
+            if len(sa) != len(sb) or set(sa) & set(sb):
+                continue
+            swap = dict(zip(sa, sb))
+            swap.update(zip(sb, sa))
+            key = frozenset(swap.items())
+            if key in tried:
+                continue
+            tried.add(key)
+            first = None
+            for v in variables:
+                sections = frozenset(meta[v]['sections'])
+                image = frozenset(swap.get(x, x) for x in sections)
+                if image == sections:
+                    continue
+                w = by_sections.get((meta[v]['course'], session(v), image))
+                if w is None or not same_domain(v, w):
+                    break
+                if first is None:
+                    first = (v, w)
+            else:
+                pairs.append(first)
+    return pairs
+
+
+def room_classes(variables, room_masks):
+    """
+    room -> representative of its class of identical rooms: rooms that are
+    candidates of exactly the same variables. Rooms only conflict per slot,
+    so exchanging two identical rooms at one slot maps timetables to
+    timetables.
+    """
+    users = defaultdict(int)
+    for k, v in enumerate(variables):
+        for room in bit_indexes(room_masks[v]):
+            users[room] |= 1 << k
+    representative = {}
+    classes = {}
+    for room in sorted(users):
+        representative[room] = classes.setdefault(users[room], room)
+    return representative
+
+
+class MRVQueue:
+    """
+    Priority queue of unassigned variables for MRV selection.
+
+    A lazy-deletion heap: key(var) gives the current (domain size, -degree,
+    index) priority, callers push a variable whenever its key may have
+    changed, and entries whose key is no longer current are skipped on pop.
+    """
+
+    def __init__(self, variables, key):
+        self.key = key
+        self.queued = {v: key(v) for v in variables}  # var -> key of its live entry
+        self.heap = [(k, v) for v, k in self.queued.items()]
+        heapq.heapify(self.heap)
+
+    def push(self, var):
+        k = self.key(var)
+        if self.queued.get(var) != k:
+            self.queued[var] = k
+            heapq.heappush(self.heap, (k, var))
+            if len(self.heap) > 4 * len(self.queued) + 64:
+                # Too many stale entries: rebuild from the live keys
+                self.heap = [(k, v) for v, k in self.queued.items()]
+                heapq.heapify(self.heap)
+
+    def pop(self):
+        while self.heap:
+            k, var = heapq.heappop(self.heap)
+            if self.queued.get(var) == k:
+                del self.queued[var]
+                return var
+        return None
+
+
+class SearchState:
+    """
+    Live domains, occupancy and undo trail of one forward_checking_search.
+
+    Each factored domain is pruned at the set level:
+      slot_open[v][t]        - False once a section of v is busy at slot t
+      free_instructors[v][t] - candidate instructors of v still free at slot t
+      free_rooms[v][t]       - candidate rooms of v still free at slot t
+    so |domain(v)| = sum over open t of free_instructors * free_rooms.
+    Candidate sets are integer bitmasks over catalog IDs:
+      instructor_masks[v][t] - instructors v may use at slot t (0 outside its slots)
+      room_masks[v]          - rooms v may use
+      ac_instructors[v][t]   - instructors removed from v at slot t by arc consistency
+      ac_rooms[v][t]         - rooms removed from v at slot t by arc consistency
+    A candidate is live when it is in the mask, not busy at t and not removed.
+
+    Every domain change is logged on one trail, which undo_to pops back to a
+    mark, and past_fc[v] counts the assigned variables blamed for pruning v.
+    The propagation and value ordering helpers below take the state
+    explicitly; queue (an MRVQueue) is pushed whenever a domain changes.
+    """
+
+    def __init__(self, variables, domains, meta, rng=None):
+        self.variables = variables
+        self.meta = meta
+        self.rng = rng
+        self.queue = None
+        self.assignment = {}
+        n_slots = self.n_slots = len(domains.catalog.timeslots)
+        self.instructor_masks = {}
+        self.room_masks = {}
+        self.ac_instructors = {}
+        self.ac_rooms = {}
+        self.slot_lists = {}
+        self.slot_open = {}
+        self.free_instructors = {}
+        self.free_rooms = {}
+        self.dom_size = {}
+        for v in variables:
+            dom = domains[v]
+            masks = [0] * n_slots
+            counts = [0] * n_slots
+            for pos, t in enumerate(dom.slots.tolist()):
+                instrs = dom.instructors_at(pos).tolist()
+                masks[t] = sum(1 << i for i in instrs)
+                counts[t] = len(instrs)
+            self.instructor_masks[v] = masks
+            self.room_masks[v] = sum(1 << r for r in set(dom.rooms.tolist()))
+            self.ac_instructors[v] = [0] * n_slots
+            self.ac_rooms[v] = [0] * n_slots
+            self.slot_lists[v] = dom.slots.tolist()
+            self.free_instructors[v] = counts
+            self.free_rooms[v] = [len(dom.rooms) if masks[t] else 0 for t in range(n_slots)]
+            self.slot_open[v] = [counts[t] > 0 and self.free_rooms[v][t] > 0 for t in range(n_slots)]
+            self.dom_size[v] = len(dom)
+
+        # Constraint graph from inverted indexes: section / instructor / room -> variables.
+        # Two variables only conflict when they share one of these resources and a slot,
+        # so edges come from OR-ing per-resource bitmasks of variable indexes.
+        var_bit = {v: 1 << k for k, v in enumerate(variables)}
+        section_vars = defaultdict(int)
+        self.instructor_vars = defaultdict(list)
+        self.room_vars = defaultdict(list)
+        slot_vars = [0] * n_slots
+        for v in variables:
+            for section in meta[v]['sections']:
+                section_vars[section] |= var_bit[v]
+            for instr in self.dom_instructors(v):
+                self.instructor_vars[instr].append(v)
+            for room in bit_indexes(self.room_masks[v]):
+                self.room_vars[room].append(v)
+            for t in range(n_slots):
+                if self.slot_open[v][t]:
+                    slot_vars[t] |= var_bit[v]
+        instructor_var_masks = {i: sum(var_bit[v] for v in vs) for i, vs in self.instructor_vars.items()}
+        room_var_masks = {r: sum(var_bit[v] for v in vs) for r, vs in self.room_vars.items()}
+        # The variables that may ever use each slot, for the pigeonhole check
+        self.slot_var_lists = [self.mask_to_vars(mask) for mask in slot_vars]
+
+        self.constraint_neighbors = {}
+        self.section_neighbors = {}  # neighbors that share a section can never use the same slot
+        for v in variables:
+            shared_slot = 0
+            for t in range(n_slots):
+                if self.slot_open[v][t]:
+                    shared_slot |= slot_vars[t]
+            shared_slot &= ~var_bit[v]
+            by_section = 0
+            for section in meta[v]['sections']:
+                by_section |= section_vars[section]
+            by_resource = by_section
+            for instr in self.dom_instructors(v):
+                by_resource |= instructor_var_masks[instr]
+            for room in bit_indexes(self.room_masks[v]):
+                by_resource |= room_var_masks[room]
+            self.constraint_neighbors[v] = self.mask_to_vars(by_resource & shared_slot)
+            self.section_neighbors[v] = self.mask_to_vars(by_section & shared_slot)
+        self.section_sets = {v: set(ns) for v, ns in self.section_neighbors.items()}
+
+        # Symmetry breaking, filled in by the search when enabled:
+        #   lex_after[v]  - variables whose slot may not precede v's
+        #   lex_before[w] - variables whose slot may not follow w's
+        #   room_class    - room -> representative of its identical rooms
+        self.lex_after = defaultdict(list)
+        self.lex_before = defaultdict(list)
+        self.room_class = None
+
+        # Occupancy per slot as bitmasks over catalog IDs
+        self.busy_instructors = [0] * n_slots
+        self.busy_rooms = [0] * n_slots
+        self.slot_usage = [0] * n_slots  # instructors + rooms in use per slot
+        # Slots as (usage, tie rank, slot), kept sorted as occupy/release change
+        # the usage, so value ordering walks slots by load without sorting per node
+        self.slot_rank = list(range(n_slots))
+        self.slots_by_load = [(0, t, t) for t in range(n_slots)]
+
+        # (neighbor, slot, lost instructor count, lost room count, lost values, slot closed,
+        #  culprits, instructor bit removed by arc consistency, room bit removed by it)
+        self.trail = []
+        self.past_fc = defaultdict(dict)
+
+    def dom_instructors(self, v):
+        mask = 0
+        for m in self.instructor_masks[v]:
+            mask |= m
+        return bit_indexes(mask)
+
+    def mask_to_vars(self, mask):
+        return [self.variables[k] for k in bit_indexes(mask)]
+
+    def live_instructors(self, v, t):
+        return self.instructor_masks[v][t] & ~self.busy_instructors[t] & ~self.ac_instructors[v][t]
+
+    def live_rooms(self, v, t):
+        return self.room_masks[v] & ~self.busy_rooms[t] & ~self.ac_rooms[v][t]
+
+    def live_at(self, v, t):
+        return (v not in self.assignment and self.slot_open[v][t]
+                and self.free_instructors[v][t] and self.free_rooms[v][t])
+
+    def single_slot(self, v):
+        """The only slot v still has values at, or None when it has none or several"""
+        found = None
+        for t in self.slot_lists[v]:
+            if self.slot_open[v][t] and self.free_instructors[v][t] and self.free_rooms[v][t]:
+                if found is not None:
+                    return None
+                found = t
+        return found
+
+    def set_usage(self, t, usage):
+        del self.slots_by_load[bisect_left(self.slots_by_load, (self.slot_usage[t], self.slot_rank[t], t))]
+        self.slot_usage[t] = usage
+        insort(self.slots_by_load, (usage, self.slot_rank[t], t))
+
+    def shuffle_slots(self):
+        """Redraw the tie ranks of equally loaded slots from rng"""
+        self.rng.shuffle(self.slot_rank)
+        self.slots_by_load[:] = sorted((self.slot_usage[t], self.slot_rank[t], t) for t in range(self.n_slots))
+
+    def occupy(self, var, val):
+        """Mark the instructor and room busy at the slot. Section clashes are
+        already excluded by slot_open, which forward checking closes per
+        section neighbor."""
+        ts, instr, room = val
+        self.assignment[var] = val
+        self.busy_instructors[ts] |= 1 << instr
+        self.busy_rooms[ts] |= 1 << room
+        self.set_usage(ts, self.slot_usage[ts] + 2)
+
+    def release(self, var, val):
+        ts, instr, room = val
+        self.busy_instructors[ts] &= ~(1 << instr)
+        self.busy_rooms[ts] &= ~(1 << room)
+        self.set_usage(ts, self.slot_usage[ts] - 2)
+        del self.assignment[var]
+
+    def prune(self, neighbor, ts, culprits, close, di=0, dr=0, ibit=0, rbit=0):
+        """Shrink neighbor's factors at slot ts, logging the change; False on a wipe-out"""
+        fi = self.free_instructors[neighbor][ts]
+        fr = self.free_rooms[neighbor][ts]
+        if close:
+            lost = fi * fr
+            self.slot_open[neighbor][ts] = False
+        else:
+            lost = fi * fr - (fi - di) * (fr - dr)
+            self.free_instructors[neighbor][ts] = fi - di
+            self.free_rooms[neighbor][ts] = fr - dr
+            self.ac_instructors[neighbor][ts] |= ibit
+            self.ac_rooms[neighbor][ts] |= rbit
+        self.trail.append((neighbor, ts, di, dr, lost, close, culprits, ibit, rbit))
+        blamed = self.past_fc[neighbor]
+        for culprit in culprits:
+            blamed[culprit] = blamed.get(culprit, 0) + 1
+        self.dom_size[neighbor] -= lost
+        self.queue.push(neighbor)
+        return self.dom_size[neighbor] > 0
+
+    def undo_to(self, mark):
+        trail = self.trail
+        while len(trail) > mark:
+            neighbor, ts, di, dr, lost, closed, culprits, ibit, rbit = trail.pop()
+            self.dom_size[neighbor] += lost
+            if closed:
+                self.slot_open[neighbor][ts] = True
+            else:
+                self.free_instructors[neighbor][ts] += di
+                self.free_rooms[neighbor][ts] += dr
+                self.ac_instructors[neighbor][ts] &= ~ibit
+                self.ac_rooms[neighbor][ts] &= ~rbit
+            blamed = self.past_fc[neighbor]
+            for culprit in culprits:
+                if blamed[culprit] == 1:
+                    del blamed[culprit]
+                else:
+                    blamed[culprit] -= 1
+            self.queue.push(neighbor)
+
+
+def forward_check(state, var, ts, instr, room):
+    """
+    Forward checking - only the variables contending for a section, the
+    instructor or the room just taken at slot ts are touched, plus those
+    ordered against var by symmetry breaking.
+    Returns the neighbor whose domain was wiped out, or None.
+    """
+    assignment = state.assignment
+    slot_open = state.slot_open
+    prune = state.prune
+    culprits = (var,)
+    for neighbor in state.section_neighbors[var]:
+        if neighbor not in assignment and slot_open[neighbor][ts] and not prune(neighbor, ts, culprits, True):
+            return neighbor
+    instr_bit = 1 << instr
+    for neighbor in state.instructor_vars[instr]:
+        if (neighbor != var and neighbor not in assignment and slot_open[neighbor][ts]
+                and state.instructor_masks[neighbor][ts] & ~state.ac_instructors[neighbor][ts] & instr_bit
+                and not prune(neighbor, ts, culprits, False, di=1)):
+            return neighbor
+    room_bit = 1 << room
+    for neighbor in state.room_vars[room]:
+        if (neighbor != var and neighbor not in assignment and slot_open[neighbor][ts]
+                and not state.ac_rooms[neighbor][ts] & room_bit and not prune(neighbor, ts, culprits, False, dr=1)):
+            return neighbor
+    for neighbor in state.lex_after.get(var, ()):
+        if neighbor not in assignment:
+            for t in state.slot_lists[neighbor]:
+                if t < ts and slot_open[neighbor][t] and not prune(neighbor, t, culprits, True):
+                    return neighbor
+    for neighbor in state.lex_before.get(var, ()):
+        if neighbor not in assignment:
+            for t in state.slot_lists[neighbor]:
+                if t > ts and slot_open[neighbor][t] and not prune(neighbor, t, culprits, True):
+                    return neighbor
+    return None
+
+
+def revise_arcs(state, changed, stats):
+    """
+    AC-3 over the resource constraints, starting from the arcs into the
+    changed variables. A value (t, i, r) of x loses its support in y only
+    when all of y's live values sit at slot t and clash with it: y shares
+    a section with x, or is down to instructor i, or to room r at t. So
+    each revision is a constant-time check on y's counters, and only a
+    variable confined to one slot can prune its neighbors. The pruning is
+    blamed on whatever confined y. Returns the wiped-out variable, or None.
+    """
+    live_at = state.live_at
+    prune = state.prune
+    pending = list(changed)
+    queued = set(pending)
+    while pending:
+        y = pending.pop()
+        queued.discard(y)
+        if y in state.assignment:
+            continue
+        t = state.single_slot(y)
+        if t is None:
+            continue
+        culprits = tuple(state.past_fc[y])
+        revised = []
+        for x in state.section_neighbors[y]:
+            if live_at(x, t):
+                stats['ac_prunes'] += 1
+                revised.append(x)
+                if not prune(x, t, culprits, True):
+                    return x
+        if state.free_instructors[y][t] == 1:
+            instr = bit_indexes(state.live_instructors(y, t))[0]
+            ibit = 1 << instr
+            for x in state.instructor_vars[instr]:
+                if x != y and live_at(x, t) and state.live_instructors(x, t) & ibit:
+                    stats['ac_prunes'] += 1
+                    revised.append(x)
+                    if not prune(x, t, culprits, False, di=1, ibit=ibit):
+                        return x
+        if state.free_rooms[y][t] == 1:
+            room = bit_indexes(state.live_rooms(y, t))[0]
+            rbit = 1 << room
+            for x in state.room_vars[room]:
+                if x != y and live_at(x, t) and state.live_rooms(x, t) & rbit:
+                    stats['ac_prunes'] += 1
+                    revised.append(x)
+                    if not prune(x, t, culprits, False, dr=1, rbit=rbit):
+                        return x
+        for x in revised:
+            if x not in queued:
+                queued.add(x)
+                pending.append(x)
+    return None
+
+
+def pigeonhole_conflict(state, t):
+    """
+    The pending variables confined to slot t each need their own sections,
+    instructor and room there. If they need more instructors or rooms than
+    their live candidates at t cover, or share a section, return the
+    assigned variables that explain it (those at t and those that
+    confined them); otherwise None.
+    """
+    forced = [v for v in state.slot_var_lists[t] if state.live_at(v, t) and state.single_slot(v) == t]
+    if len(forced) < 2:
+        return None
+    instrs = rooms = 0
+    sections = set()
+    clash = False
+    for v in forced:
+        instrs |= state.live_instructors(v, t)
+        rooms |= state.live_rooms(v, t)
+        for section in state.meta[v]['sections']:
+            clash = clash or section in sections
+            sections.add(section)
+    if not clash and len(forced) <= bin(instrs).count('1') and len(forced) <= bin(rooms).count('1'):
+        return None
+    conflict = {v for v, val in state.assignment.items() if val[SLOT] == t}
+    for v in forced:
+        conflict.update(state.past_fc[v])
+    return conflict
+
+
+class NogoodStore:
+    """
+    Bounded store of nogoods: sets of (var, value) that no solution contains,
+    learned from backjump conflict sets. Each nogood is indexed by its
+    literals, and past the limit the oldest one is forgotten.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.nogoods = OrderedDict()  # nogood -> None, oldest first
+        self.watch = defaultdict(set)  # (var, value) -> nogoods containing it
+
+    def __len__(self):
+        return len(self.nogoods)
+
+    def learn(self, conflict, assignment):
+        """Store the current values of the conflict variables; True if it was new"""
+        if not self.limit or not conflict or len(conflict) > MAX_NOGOOD_LITERALS:
             return False
-        # Check if any section in this variable's group is already assigned at this timeslot
-        if var_sections & ts_data['sections']:
+        nogood = frozenset((v, assignment[v]) for v in conflict)
+        if nogood in self.nogoods:
             return False
+        self.nogoods[nogood] = None
+        for literal in nogood:
+            self.watch[literal].add(nogood)
+        if len(self.nogoods) > self.limit:
+            oldest, _ = self.nogoods.popitem(last=False)
+            for literal in oldest:
+                self.watch[literal].discard(oldest)
         return True
 
-    def select_unassigned_var():
-        """Select variable using MRV with dynamic degree heuristic"""
-        unassigned = [v for v in variables if v not in assignment]
-        if not unassigned:
-            return None
-        
-        # MRV: choose variable with smallest domain
-        # Degree: break ties with most constraints on remaining variables
-        def heuristic(x):
-            domain_size = len(local_domains.get(x, []))
-            if domain_size == 0:
-                return (0, 0)  # Dead end - prioritize to fail fast
-            # Count unassigned neighbors
-            unassigned_neighbors = sum(1 for n in constraint_neighbors.get(x, []) 
-                                    if n not in assignment)
-            return (domain_size, -unassigned_neighbors)
-        
-        return min(unassigned, key=heuristic)
+    def violated(self, var, val, assignment):
+        """A stored nogood that var=val would complete under the assignment"""
+        for nogood in self.watch.get((var, val), ()):
+            if all(v == var or assignment.get(v) == w for v, w in nogood):
+                return nogood
+        return None
+
+
+def slot_rooms(state, var, t):
+    """Live rooms of var at t, one per class of identical rooms"""
+    ts_rooms = bit_indexes(state.live_rooms(var, t))
+    if state.rng is not None:
+        state.rng.shuffle(ts_rooms)
+    if state.room_class is not None:
+        # Identical rooms free at t lead to mirror-image subtrees
+        classes = {}
+        for room in ts_rooms:
+            classes.setdefault(state.room_class[room], room)
+        ts_rooms = list(classes.values())
+    return ts_rooms
+
+
+def values_by_load(state, var, skip=None):
+    """Live values of var but skip, slot by slot"""
+    slot_open = state.slot_open[var]
+    # For larger domains, prioritize timeslots with fewer assignments
+    # This is a fast approximation of least-constraining-value
+    if state.dom_size[var] > 10:
+        slots = [t for _, _, t in state.slots_by_load if slot_open[t]]
+    else:
+        slots = [t for t in state.slot_lists[var] if slot_open[t]]
+        if state.rng is not None:
+            state.rng.shuffle(slots)
+    for t in slots:
+        ts_rooms = slot_rooms(state, var, t)
+        for instr in bit_indexes(state.live_instructors(var, t)):
+            for room in ts_rooms:
+                if (t, instr, room) != skip:
+                    yield (t, instr, room)
+
+
+def values_removed(state, var, val):
+    """LCV cost of var=val: the values it takes from unassigned neighbors"""
+    ts, instr, room = val
+    assignment = state.assignment
+    slot_open = state.slot_open
+    section_set = state.section_sets[var]
+    removed = 0
+    for n in state.section_neighbors[var]:
+        if n not in assignment and slot_open[n][ts]:
+            removed += state.free_instructors[n][ts] * state.free_rooms[n][ts]
+    lost_instructor = set()
+    for n in state.instructor_vars[instr]:
+        if (n != var and n not in assignment and n not in section_set and slot_open[n][ts]
+                and state.live_instructors(n, ts) >> instr & 1):
+            removed += state.free_rooms[n][ts]
+            lost_instructor.add(n)
+    for n in state.room_vars[room]:
+        if (n != var and n not in assignment and n not in section_set and slot_open[n][ts]
+                and state.live_rooms(n, ts) >> room & 1):
+            # (ts, instr, room) itself was already counted with the instructor
+            removed += state.free_instructors[n][ts] - (n in lost_instructor)
+    return removed
+
+
+def sampled_values(state, var, size, rng):
+    """Up to size distinct live values of var drawn at random"""
+    slots = [t for t in state.slot_lists[var] if state.slot_open[var][t]]
+    sample = set()
+    for _ in range(size):
+        t = rng.choice(slots)
+        instrs = bit_indexes(state.live_instructors(var, t))
+        rooms = slot_rooms(state, var, t)
+        if instrs and rooms:
+            sample.add((t, rng.choice(instrs), rng.choice(rooms)))
+    return sorted(sample)
+
+
+def order_domain_values(state, var, hint=None, value_ordering='load', lcv_sample=LCV_SAMPLE, lcv_rng=None):
+    """Lazily enumerate the live values of var, its hint first (see forward_checking_search)"""
+    if hint is not None:
+        ts, instr, room = hint
+        if (0 <= ts < state.n_slots and state.slot_open[var][ts] and state.live_instructors(var, ts) >> instr & 1
+                and state.live_rooms(var, ts) >> room & 1):
+            yield hint
+    if value_ordering != 'lcv':
+        yield from values_by_load(state, var, hint)
+        return
+    if state.dom_size[var] <= lcv_sample:
+        yield from sorted(values_by_load(state, var, hint), key=lambda val: values_removed(state, var, val))
+        return
+    tried = {hint}
+    for val in sorted(sampled_values(state, var, lcv_sample, lcv_rng), key=lambda val: values_removed(state, var, val)):
+        if val not in tried:
+            tried.add(val)
+            yield val
+    for val in values_by_load(state, var):
+        if val not in tried:
+            yield val
+
+
+def forward_checking_search(variables, domains, meta, backjumping=True, nogood_limit=0, propagation='fc',
+                            pigeonhole=False, variable_ordering='mrv', seed=None, restarts=None, restart_base=100,
+                            time_limit=None, node_limit=None, stop_event=None, stats=None, fixed=None,
+                            symmetry=True, hints=None, value_ordering='load', lcv_sample=LCV_SAMPLE):
+    """
+    Forward-checking search with MRV/degree variable selection.
+
+    variable_ordering='domwdeg' instead picks the smallest ratio of domain
+    size to weighted degree, where a constraint's weight grows every time it
+    wipes out a domain. With a seed, ties between variables and between
+    equally loaded slots are broken at random instead of by input order.
+
+    value_ordering='load' tries the values of a variable slot by slot, least
+    loaded slots first (for domains of more than 10 values). 'lcv' first
+    tries values by how few values they remove from unassigned neighbors;
+    domains larger than lcv_sample rank a random sample of that many values
+    and fall back to load order for the rest.
+
+    restarts ('luby' or 'geometric') abandons a run once it has failed
+    restart_base times the schedule's next term, and starts over with fresh
+    random tie-breaking; dom/wdeg weights and learned nogoods carry over. The
+    first run keeps the deterministic order unless a seed is given, so inputs
+    solved before the first cutoff give the same timetable as without restarts.
+
+    With backjumping, a failed variable jumps straight back to the deepest
+    assignment in its conflict set instead of the previous level. With
+    nogood_limit > 0, up to that many learned nogoods (short conflict sets
+    with their values) are kept and never retried.
+
+    propagation='ac3' maintains arc consistency on top of forward checking,
+    at the root and after every assignment. pigeonhole=True also fails a
+    node as soon as the variables left with a single slot t need more
+    rooms or instructors than are still free at t.
+
+    time_limit (seconds) and node_limit (search nodes) bound the search, and
+    setting stop_event (a threading or multiprocessing Event) cancels it;
+    any of these makes it give up and return None like a failed search. If
+    given, the stats dict is filled with the search counters, plus 'stopped'
+    (None, 'time_limit', 'node_limit' or 'cancelled'), 'best_partial' (the
+    largest consistent partial assignment reached) and 'unassigned' (the
+    variables missing from it).
+
+    fixed ({var: value}, vars among variables) is assigned and propagated at
+    the root and never revisited; the search only completes the rest around
+    it, and returns None (not stopped) when no completion exists.
+
+    hints ({var: value}, e.g. from timetable_hints) are tried before any
+    other value of their variable while still live; stats['hints_kept']
+    counts the hinted variables that end up with their hint.
+
+    symmetry=True breaks the symmetries found by group_symmetries (without
+    fixed values or hints, which may already break them) with lex-leader constraints
+    on the slots of interchangeable groups, and tries only one room of each
+    class of identical rooms (room_classes) at a slot. Neither loses a
+    solution up to symmetry.
+    """
+    if propagation not in PROPAGATION_LEVELS:
+        raise ValueError(f"Unknown propagation level {propagation!r}; expected one of {PROPAGATION_LEVELS}")
+    if variable_ordering not in VARIABLE_ORDERINGS:
+        raise ValueError(f"Unknown variable ordering {variable_ordering!r}; expected one of {VARIABLE_ORDERINGS}")
+    if value_ordering not in VALUE_ORDERINGS:
+        raise ValueError(f"Unknown value ordering {value_ordering!r}; expected one of {VALUE_ORDERINGS}")
+    if restarts is not None and restarts not in RESTART_SCHEDULES:
+        raise ValueError(f"Unknown restart schedule {restarts!r}; expected one of {RESTART_SCHEDULES}")
+    fixed = fixed or {}
+    hints = hints or {}
+    if not set(fixed) <= set(variables):
+        raise ValueError("fixed assigns variables that are not being searched")
+    rng = random.Random(seed) if seed is not None else None
+    restart_rng = rng if rng is not None else random.Random(0)
+    lcv_rng = rng if rng is not None else random.Random(0)
+    arc_consistency = propagation == 'ac3'
+    state = SearchState(variables, domains, meta, rng)
+    assignment = state.assignment
+    trail = state.trail
+    past_fc = state.past_fc
+    constraint_neighbors = state.constraint_neighbors
+    print(f"[csp] Constraint graph built - avg neighbors: {sum(len(n) for n in constraint_neighbors.values())/len(constraint_neighbors):.1f}")
     
-    def order_domain_values(var):
-        """Order domain values - simplified for speed"""
-        domain_vals = local_domains.get(var, [])
-        
-        # For small domains, return as-is
-        if len(domain_vals) <= 10:
-            return domain_vals
-        
-        # For larger domains, prioritize timeslots with fewer assignments
-        # This is a fast approximation of least-constraining-value
-        def timeslot_score(val):
-            ts = val['timeslot']
-            ts_data = assigned_by_timeslot.get(ts, {})
-            # Count resources already used in this timeslot
-            used_count = len(ts_data.get('instructor', set())) + len(ts_data.get('room', set()))
-            return used_count
-        
-        # Sort by timeslot usage
-        return sorted(domain_vals, key=timeslot_score)
+    # Symmetry breaking: slot(v) <= slot(w) for each interchangeable pair, and
+    # one room per class of identical rooms when enumerating a slot's values
+    if symmetry:
+        if not fixed and not hints:
+            for v, w in group_symmetries(variables, domains, meta):
+                state.lex_after[v].append(w)
+                state.lex_before[w].append(v)
+        state.room_class = room_classes(variables, state.room_masks)
+        identical = len(state.room_class) - len(set(state.room_class.values()))
+        print(f"[csp] Symmetry breaking: {sum(map(len, state.lex_after.values()))} group orderings, "
+              f"{identical} rooms identical to another")
 
-    backtrack_calls = [0]
-    max_depth = [0]
+    # MRV: choose variable with smallest domain
+    # Degree: break ties with most constraints on remaining variables,
+    # then with variable order (shuffled when seeded)
+    var_index = {v: k for k, v in enumerate(variables)}
+    tie_rank = dict(var_index)
     
-    def backtrack(depth=0):
-        backtrack_calls[0] += 1
-        max_depth[0] = max(max_depth[0], depth)
-        
-        if len(assignment) == len(variables):
-            return True
-        
-        var = select_unassigned_var()
-        if var is None:
-            return True
-        
-        # Check if domain is empty (dead end)
-        domain_vals = order_domain_values(var)
-        if not domain_vals:
-            return False
+    def shuffle_ties():
+        ranks = list(range(len(variables)))
+        state.rng.shuffle(ranks)
+        tie_rank.update(zip(variables, ranks))
+        state.shuffle_slots()
+    
+    if rng is not None:
+        shuffle_ties()
+    degree = {v: len(constraint_neighbors[v]) for v in variables}  # unassigned neighbors
+    # dom/wdeg: constraint weights start at 1 and are kept per neighbor pair,
+    # wdeg[v] sums the weights of v's constraints on unassigned variables
+    domwdeg = variable_ordering == 'domwdeg'
+    edge_weight = {}
+    wdeg = dict(degree)
+    neighbor_sets = {v: set(constraint_neighbors[v]) for v in variables} if domwdeg else None
+    
+    def weight(a, b):
+        return edge_weight.get((a, b) if var_index[a] < var_index[b] else (b, a), 1)
+    
+    def bump_weight(a, b):
+        """A wipe-out of b by a: weigh their constraint up (a is assigned, b is not)"""
+        key = (a, b) if var_index[a] < var_index[b] else (b, a)
+        edge_weight[key] = edge_weight.get(key, 1) + 1
+        wdeg[a] += 1
+    
+    dom_size = state.dom_size
+    
+    def mrv_key(x):
+        if dom_size[x] == 0:
+            return (0, 0, tie_rank[x])  # Dead end - prioritize to fail fast
+        if domwdeg:
+            return (dom_size[x] / max(wdeg[x], 1), 0, tie_rank[x])
+        return (dom_size[x], -degree[x], tie_rank[x])
+    
+    queue = state.queue = MRVQueue(variables, mrv_key)
+    
+    def set_assigned(var, assigned):
+        """Keep neighbor degrees (and so their queue keys) in step with assignment"""
+        step = -1 if assigned else 1
+        for n in constraint_neighbors[var]:
+            degree[n] += step
+            if domwdeg:
+                wdeg[n] += step * weight(var, n)
+            if n not in assignment:
+                queue.push(n)
+    
+    # Conflict-directed backjumping: conf_set[v] holds the past variables
+    # blamed for v's rejected values (state.past_fc those whose propagation
+    # pruned v)
+    conf_set = {}
+    
+    def propagate(var, val, mark):
+        """
+        Forward check var=val, then run the stronger propagation selected.
+        Returns the set of assigned variables that explain a failure, or None.
+        """
+        wiped = forward_check(state, var, *val)
+        if wiped is None and arc_consistency:
+            wiped = revise_arcs(state, {entry[0] for entry in trail[mark:]}, stats)
+        if wiped is not None:
+            if domwdeg and wiped in neighbor_sets[var]:
+                bump_weight(var, wiped)
+            return set(past_fc[wiped])
+        if pigeonhole:
+            touched = {val[SLOT]}
+            for neighbor in {entry[0] for entry in trail[mark:]}:
+                touched.add(state.single_slot(neighbor))
+            touched.discard(None)
+            for t in touched:
+                conflict = pigeonhole_conflict(state, t)
+                if conflict is not None:
+                    stats['pigeonhole_failures'] += 1
+                    return conflict
+        return None
+    
+    nogoods = NogoodStore(nogood_limit)
+    
+    # Iterative depth-first search: one frame per decision on an explicit stack,
+    # [var, lazy value iterator, value being tried, trail mark before trying it]
+    stack = []
+    level = {}  # var -> index of its frame
+    stats = {} if stats is None else stats
+    stats.update(backtrack_calls=0, max_depth=0, backjumps=0, nogoods_learned=0, nogood_prunes=0,
+                 propagation=propagation, ac_prunes=0, pigeonhole_failures=0, fails=0, restarts=0)
+    success = False
+    descend = True
+    restart = False
+    stopped = None
+    cutoffs = restart_cutoffs(restarts, restart_base) if restarts else None
+    cutoff = next(cutoffs) if cutoffs else None
+    run_fails = 0
+    run_start = 0  # backtrack_calls when the current run started
+    best_partial = {}
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    ticks = 0
+    
+    # Fixed assignments and root propagation: their prunings sit below every
+    # frame's mark and are never undone
+    for var, val in fixed.items():
+        ts, instr, room = val
+        if not (state.slot_open[var][ts] and state.live_instructors(var, ts) >> instr & 1
+                and state.live_rooms(var, ts) >> room & 1):
+            descend = False
+            break
+        queue.queued.pop(var, None)
+        set_assigned(var, True)
+        state.occupy(var, val)
+        if propagate(var, val, len(trail)) is not None:
+            descend = False
+            break
+    if descend and arc_consistency and revise_arcs(state, variables, stats) is not None:
+        descend = False
+    elif descend and pigeonhole and any(pigeonhole_conflict(state, t) is not None for t in range(state.n_slots)):
+        stats['pigeonhole_failures'] += 1
+        descend = False
+    
+    def abandon(frame):
+        """Drop a frame: undo its current value and return its variable to the queue"""
+        var, _, val, mark = frame
+        if val is not None:
+            state.undo_to(mark)
+            state.release(var, val)
+        del level[var]
+        conf_set.pop(var, None)
+        set_assigned(var, False)
+        queue.push(var)
+    
+    print("[csp] Starting backtracking search...")
+    while True:
+        if descend:
+            if len(assignment) > len(best_partial):
+                best_partial = dict(assignment)
+            if node_limit is not None and stats['backtrack_calls'] >= node_limit:
+                stopped = 'node_limit'
+                break
+            stats['backtrack_calls'] += 1
+            stats['max_depth'] = max(stats['max_depth'], len(stack))
+            var = queue.pop()
+            if var is None:
+                success = True
+                break
+            # Values are generated from the live factors, so they are consistent by
+            # construction; an empty domain simply exhausts the frame at once
+            set_assigned(var, True)
+            level[var] = len(stack)
+            conf_set[var] = set()
+            values = order_domain_values(state, var, hints.get(var), value_ordering, lcv_sample, lcv_rng)
+            stack.append([var, values, None, len(trail)])
         
-        for val in domain_vals:
-            if not consistent(var, val):
-                continue
-            
-            assignment[var] = val
-            ts = val['timeslot']
-            
-            # Update timeslot tracking - add instructor, room, AND sections
-            if ts not in assigned_by_timeslot:
-                assigned_by_timeslot[ts] = {'instructor': set(), 'room': set(), 'sections': set()}
-            assigned_by_timeslot[ts]['instructor'].add(val['instructor'])
-            assigned_by_timeslot[ts]['room'].add(val['room'])
-            # Add all sections from this variable's group to the timeslot
-            for section in meta[var]['sections']:
-                assigned_by_timeslot[ts]['sections'].add(section)
-            
-            removed = {}
-            failure = False
-            
-            # Forward checking - prune inconsistent values from neighbor domains
-            for neighbor in constraint_neighbors.get(var, []):
-                if neighbor in assignment:
-                    continue
-                
-                # Get sections for the neighbor variable
-                neighbor_sections = set(meta[neighbor]['sections'])
-                
-                newdom = []
-                for nval in local_domains.get(neighbor, []):
-                    # Keep if different timeslot or no conflicts (instructor, room, or sections)
-                    if nval['timeslot'] != ts:
-                        newdom.append(nval)
-                    elif (nval['instructor'] != val['instructor'] and 
-                          nval['room'] != val['room'] and 
-                          not (neighbor_sections & assigned_by_timeslot[ts]['sections'])):
-                        newdom.append(nval)
-                
-                if len(newdom) == 0:
-                    failure = True
+        # Advance the deepest decision to its next value, backing up when one runs out
+        descend = False
+        while stack:
+            ticks += 1
+            if not ticks & 63:
+                if deadline is not None and time.monotonic() >= deadline:
+                    stopped = 'time_limit'
                     break
-                
-                if len(newdom) < len(local_domains[neighbor]):
-                    removed[neighbor] = local_domains[neighbor]
-                    local_domains[neighbor] = newdom
-            
-            if not failure:
-                result = backtrack(depth + 1)
-                if result:
-                    return True
-            
-            # Restore domains
-            for k, v in removed.items():
-                local_domains[k] = v
-            
-            # Restore timeslot tracking - remove instructor, room, AND sections
-            assigned_by_timeslot[ts]['instructor'].discard(val['instructor'])
-            assigned_by_timeslot[ts]['room'].discard(val['room'])
-            for section in meta[var]['sections']:
-                assigned_by_timeslot[ts]['sections'].discard(section)
-            if not assigned_by_timeslot[ts]['instructor'] and not assigned_by_timeslot[ts]['room'] and not assigned_by_timeslot[ts]['sections']:
-                del assigned_by_timeslot[ts]
-            
-            del assignment[var]
-        
-        return False
-
-    print("[csp] Starting backtracking search...")
-    success = backtrack()
-    print(f"[csp] Search complete: backtrack_calls={backtrack_calls[0]}, max_depth={max_depth[0]}")
+                if stop_event is not None and stop_event.is_set():
+                    stopped = 'cancelled'
+                    break
+            frame = stack[-1]
+            var, values, val, mark = frame
+            if val is not None:
+                state.undo_to(mark)
+                state.release(var, val)
+            val = next(values, None)
+            frame[2] = val
+            if val is None:
+                # var is exhausted: its rejected values are explained by conflict
+                conflict = conf_set[var].union(past_fc[var])
+                if nogoods.learn(conflict, assignment):
+                    stats['nogoods_learned'] += 1
+                abandon(stack.pop())
+                if backjumping and stack and stack[-1][0] not in conflict:
+                    # Jump straight back to the deepest culprit; with an empty
+                    # conflict set nothing in the past explains the failure and
+                    # the whole stack unwinds (no solution exists)
+                    stats['backjumps'] += 1
+                    while stack and stack[-1][0] not in conflict:
+                        abandon(stack.pop())
+                if stack:
+                    top = stack[-1][0]
+                    conf_set[top] |= conflict - {top}
+                continue
+            nogood = nogoods.violated(var, val, assignment) if nogoods else None
+            if nogood is not None:
+                stats['nogood_prunes'] += 1
+                frame[2] = None
+                conf_set[var] |= {v for v, _ in nogood} - {var}
+                continue
+            state.occupy(var, val)
+            conflict = propagate(var, val, mark)
+            if conflict is None:
+                descend = True
+                break
+            conf_set[var] |= conflict - {var}
+            stats['fails'] += 1
+            run_fails += 1
+            if cutoff is not None and run_fails >= cutoff:
+                restart = True
+                break
+        if restart:
+            # Start over from the root with new tie-breaking; weights and nogoods stay
+            print(f"[csp] Restart {stats['restarts'] + 1}: run reached its cutoff of {cutoff} fails "
+                  f"after {stats['backtrack_calls'] - run_start} nodes")
+            while stack:
+                abandon(stack.pop())
+            stats['restarts'] += 1
+            state.rng = restart_rng
+            shuffle_ties()
+            queue = state.queue = MRVQueue([v for v in variables if v not in assignment], mrv_key)
+            cutoff = next(cutoffs)
+            run_fails = 0
+            run_start = stats['backtrack_calls']
+            restart = False
+            descend = True
+            continue
+        if not descend:
+            break
+    
+    print(f"[csp] Search complete: backtrack_calls={stats['backtrack_calls']}, max_depth={stats['max_depth']}, "
+          f"backjumps={stats['backjumps']}, nogoods_learned={stats['nogoods_learned']}, nogood_prunes={stats['nogood_prunes']}, "
+          f"propagation={propagation}, ac_prunes={stats['ac_prunes']}, pigeonhole_failures={stats['pigeonhole_failures']}, "
+          f"fails={stats['fails']}, restarts={stats['restarts']}")
     
+    if success:
+        best_partial = assignment
+    elif stopped:
+        print(f"[csp] Search stopped by {stopped}: best partial assignment has {len(best_partial)}/{len(variables)} variables")
+    stats.update(stopped=stopped, best_partial=best_partial,
+                 unassigned=[v for v in variables if v not in best_partial])
+    if hints:
+        stats['hints_kept'] = sum(1 for v, val in hints.items() if best_partial.get(v) == val)
+        print(f"[csp] Hints: {stats['hints_kept']} of {len(hints)} hinted values kept")
     if not success:
         return None
     return assignment
 
 
+# Variants raced by portfolio_search, as forward_checking_search options
+PORTFOLIO_VARIANTS = (
+    {},
+    {'variable_ordering': 'domwdeg'},
+    {'seed': 1},
+    {'variable_ordering': 'domwdeg', 'seed': 2},
+    {'propagation': 'ac3', 'seed': 3},
+    {'propagation': 'ac3', 'variable_ordering': 'domwdeg', 'seed': 4},
+    {'restarts': 'luby', 'seed': 5},
+    {'restarts': 'luby', 'variable_ordering': 'domwdeg', 'seed': 6},
+)
+
+# State of a search worker process, set up once per process
+_search_worker = {}
+
+
+def _search_worker_init(shm_name, layout, variables, meta, catalog, stop_event):
+    """Map the packed domains from shared memory instead of receiving a copy"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arrays = {name: np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+              for name, dtype, shape, offset in layout}
+    domains = EncodedDomains(catalog)
+    domains.update(unpack_domains(variables, arrays))
+    _search_worker.update(shm=shm, variables=variables, domains=domains, meta=meta, stop_event=stop_event)
+
+
+def _portfolio_worker_run(index, options):
+    worker = _search_worker
+    if worker['stop_event'].is_set():
+        return index, None, None  # decided while this variant was still queued
+    stats = {}
+    assign = forward_checking_search(worker['variables'], worker['domains'], worker['meta'],
+                                     stop_event=worker['stop_event'], stats=stats, **options)
+    return index, assign, stats
+
+
+@contextlib.contextmanager
+def _search_pool(variables, domains, meta, workers):
+    """
+    Process pool whose workers map the packed domains from shared memory,
+    which is unlinked again on exit. Yields (pool, stop_event).
+    """
+    arrays = pack_domains(variables, domains)
+    layout, size = array_layout(arrays)
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        for name, dtype, shape, offset in layout:
+            np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)[...] = arrays[name]
+        context = multiprocessing.get_context()
+        stop_event = context.Event()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_search_worker_init,
+                                 initargs=(shm.name, layout, variables, meta, domains.catalog, stop_event)) as pool:
+            yield pool, stop_event
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def portfolio_search(variables, domains, meta, workers=None, variants=PORTFOLIO_VARIANTS, time_limit=None,
+                     stats=None, **options):
+    """
+    Race variants of forward_checking_search across CPU cores.
+
+    Each variant is a dict of search options applied over **options. The
+    first variant to reach a definite answer (a solution, or a proof that
+    none exists) wins and the others are cancelled; so are all of them when
+    time_limit runs out. The domains are packed once into shared memory that
+    every worker maps, rather than pickled per task. Returns the winning
+    assignment or None; stats receives the deciding run's counters (or the
+    best partial of all runs) plus 'winner' and per-variant 'variants'.
+    """
+    workers = workers or min(len(variants), os.cpu_count() or 1)
+    stats = {} if stats is None else stats
+    # What a timeout before any variant reports back leaves behind
+    stats.update(backtrack_calls=0, stopped=None, best_partial={}, unassigned=list(variables))
+    print(f"[csp] Portfolio search: {len(variants)} variants on {workers} workers")
+    with _search_pool(variables, domains, meta, workers) as (pool, stop_event):
+        futures = [pool.submit(_portfolio_worker_run, k, dict(options, **variant))
+                   for k, variant in enumerate(variants)]
+        deadline = None if time_limit is None else time.monotonic() + time_limit
+        results = {}
+        winner = None
+        timed_out = False
+        pending = set(futures)
+        while pending and winner is None:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                timed_out = True  # cancel the lot
+                break
+            for future in done:
+                k, assign, run_stats = future.result()
+                results[k] = (assign, run_stats)
+                if winner is None and (assign is not None or not run_stats['stopped']):
+                    winner = k
+        stop_event.set()
+        for future in pending:
+            future.cancel()
+    for future in pending:
+        if not future.cancelled():
+            k, assign, run_stats = future.result()
+            if run_stats is not None:
+                results[k] = (assign, run_stats)
+    
+    if winner is None and results:
+        # Nobody finished: report the run that got furthest
+        decider = max(results, key=lambda k: len(results[k][1]['best_partial']))
+    else:
+        decider = winner
+    if decider is not None:
+        stats.update(results[decider][1])
+    if timed_out:
+        stats['stopped'] = 'time_limit'
+    stats['winner'] = variants[winner] if winner is not None else None
+    stats['variants'] = [dict(variants[k], solved=results[k][0] is not None, nodes=results[k][1]['backtrack_calls'],
+                              stopped=results[k][1]['stopped']) for k in sorted(results)]
+    outcome = 'no variant finished' if winner is None else f"winner {variants[winner]}"
+    print(f"[csp] Portfolio search complete: {outcome}")
+    return results[winner][0] if winner is not None else None
+
+
+def resource_components(variables, domains, meta, resources=('section', 'instructor', 'room')):
+    """
+    Connected components of the resource-sharing graph, in input order.
+
+    Two variables are linked when they share a section, or (as far as
+    resources includes them) a candidate instructor or room. Variables in
+    different components never constrain each other.
+    """
+    parent = {v: v for v in variables}
+    
+    def find(v):
+        while parent[v] != v:
+            parent[v] = parent[parent[v]]
+            v = parent[v]
+        return v
+    
+    owner = {}  # resource -> first variable seen using it
+    for v in variables:
+        keys = [('section', s) for s in meta[v]['sections']]
+        if 'instructor' in resources:
+            keys += [('instructor', i) for i in domains[v].instructors.tolist()]
+        if 'room' in resources:
+            keys += [('room', r) for r in domains[v].rooms.tolist()]
+        for key in keys:
+            if key in owner:
+                parent[find(v)] = find(owner[key])
+            else:
+                owner[key] = v
+    components = {}
+    for v in variables:
+        components.setdefault(find(v), []).append(v)
+    return list(components.values())
+
+
+def clashing_variables(assignment, meta):
+    """
+    Variables to unassign so that assignment has no two classes on one
+    instructor, room or section at a slot; the first claim in order wins.
+    """
+    taken = set()
+    clashing = []
+    for v, (t, i, r) in assignment.items():
+        keys = [('i', t, i), ('r', t, r)] + [('s', t, s) for s in meta[v]['sections']]
+        if taken.isdisjoint(keys):
+            taken.update(keys)
+        else:
+            clashing.append(v)
+    return clashing
+
+
+def conflict_neighbourhood(variables, domains, meta, assignment, freed):
+    """
+    The assigned variables outside freed that could clash with a value of a
+    freed variable: they share a section with it, or hold one of its
+    candidate instructors or rooms.
+    """
+    sections, instructors, rooms = set(), set(), set()
+    for v in freed:
+        sections.update(meta[v]['sections'])
+        instructors.update(domains[v].instructors.tolist())
+        rooms.update(domains[v].rooms.tolist())
+    freed = set(freed)
+    return [v for v in variables if v in assignment and v not in freed and (
+        assignment[v][INSTRUCTOR] in instructors or assignment[v][ROOM] in rooms
+        or not sections.isdisjoint(meta[v]['sections']))]
+
+
+def repair_search(variables, domains, meta, assignment, freed, time_limit=None, stats=None, hints=None, **options):
+    """
+    Re-solve the variables in freed with the rest of assignment held fixed.
+
+    When the fixed part leaves them no solution, their conflict
+    neighbourhood is freed as well and the search retried. The values freed
+    variables had in assignment are passed on as hints (below any given
+    hints), so the result stays close to assignment. Returns the full
+    assignment, or None when neither round finds one (stats['stopped']
+    tells whether the budget ran out); stats also receives the summed
+    'backtrack_calls', 'repairs' (rounds run), 'best_partial' and
+    'unassigned'.
+    """
+    stats = {} if stats is None else stats
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    freed = set(freed)
+    stats.update(backtrack_calls=0, repairs=0, stopped=None, best_partial={}, unassigned=list(variables))
+    for widen in (False, True):
+        if widen:
+            freed.update(conflict_neighbourhood(variables, domains, meta, assignment, freed))
+        fixed = {v: assignment[v] for v in variables if v not in freed and v in assignment}
+        stats['repairs'] += 1
+        print(f"[csp] Repair: re-solving {len(variables) - len(fixed)} of {len(variables)} variables around {len(fixed)} fixed")
+        run_stats = {}
+        remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+        near = {v: assignment[v] for v in freed if v in assignment}
+        assign = forward_checking_search(variables, domains, meta, time_limit=remaining, stats=run_stats,
+                                         fixed=fixed, hints={**near, **(hints or {})}, **options)
+        stats['backtrack_calls'] += run_stats['backtrack_calls']
+        stats.update(stopped=run_stats['stopped'], best_partial=run_stats['best_partial'],
+                     unassigned=run_stats['unassigned'])
+        if assign is not None or run_stats['stopped']:
+            return assign
+    return None
+
+
+def _subproblem_worker_run(index, subset, deadline, options):
+    worker = _search_worker
+    if worker['stop_event'].is_set():
+        return index, None, None
+    time_limit = None if deadline is None else max(0.0, deadline - time.time())
+    stats = {}
+    assign = forward_checking_search(subset, worker['domains'], worker['meta'], time_limit=time_limit,
+                                     stop_event=worker['stop_event'], stats=stats, **options)
+    return index, assign, stats
+
+
+def decomposed_search(variables, domains, meta, workers=1, time_limit=None, stats=None, **options):
+    """
+    Solve independent parts of the problem separately and merge them.
+
+    The variables are split into the connected components of the
+    resource-sharing graph, and each component into blocks that share no
+    section (the year groups, and departments in years 3-4). Blocks are
+    solved independently with forward_checking_search(**options), on
+    `workers` processes when more than one, ignoring the instructors and
+    rooms they share with other blocks of their component.
+
+    Coordination is an iterative repair of each merged component: the
+    variables in a clash are unassigned and re-solved with the rest held
+    fixed; if that fails, the kept variables competing for their
+    instructors and rooms are freed as well, and finally the whole
+    component. A block without a solution proves the problem has none.
+    Returns the assignment or None; stats receives the summed node count,
+    'components', 'blocks', 'repairs', 'stopped', 'best_partial' and
+    'unassigned'.
+
+    Each search only gets the hints of its own variables, so a block
+    without hinted variables keeps its symmetry breaking.
+    """
+    stats = {} if stats is None else stats
+    deadline = None if time_limit is None else time.time() + time_limit
+    hints = options.pop('hints', None) or {}
+    
+    def remaining():
+        return None if deadline is None else max(0.0, deadline - time.time())
+    
+    def options_for(part):
+        """options with hints narrowed to the variables of part"""
+        return dict(options, hints={v: hints[v] for v in part if v in hints} or None)
+    
+    components = resource_components(variables, domains, meta)
+    blocks = [block for component in components for block in resource_components(component, domains, meta, ('section',))]
+    print(f"[csp] Decomposed search: {len(components)} components, {len(blocks)} blocks")
+    stats.update(backtrack_calls=0, components=len(components), blocks=len(blocks), repairs=0, stopped=None)
+    
+    results = {}  # block index -> (assignment or None, stats)
+    if workers > 1 and len(blocks) > 1:
+        with _search_pool(variables, domains, meta, workers) as (pool, stop_event):
+            pending = {pool.submit(_subproblem_worker_run, k, block, deadline, options_for(block))
+                       for k, block in enumerate(blocks)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    k, assign, run_stats = future.result()
+                    if run_stats is not None:
+                        results[k] = (assign, run_stats)
+                        if assign is None:
+                            stop_event.set()  # the whole problem is decided (or out of budget)
+    else:
+        for k, block in enumerate(blocks):
+            run_stats = {}
+            assign = forward_checking_search(block, domains, meta, time_limit=remaining(), stats=run_stats,
+                                             **options_for(block))
+            results[k] = (assign, run_stats)
+            if assign is None:
+                break
+    
+    merged = {}
+    for k in sorted(results):
+        stats['backtrack_calls'] += results[k][1]['backtrack_calls']
+        merged.update(results[k][1]['best_partial'])
+    
+    def finish(success):
+        if success:
+            best = merged
+        else:
+            best = dict(merged)
+            for v in clashing_variables(best, meta):
+                del best[v]
+        stats.update(best_partial=best, unassigned=[v for v in variables if v not in best])
+        return merged if success else None
+    
+    unsolved = [results[k][1]['stopped'] for k in sorted(results) if results[k][0] is None]
+    if unsolved:
+        # A block without a solution decides the problem; otherwise report why the search stopped
+        if all(unsolved):
+            stats['stopped'] = next((reason for reason in unsolved if reason != 'cancelled'), unsolved[0])
+        print(f"[csp] Decomposed search: a block {'stopped by ' + stats['stopped'] if stats['stopped'] else 'has no solution'}")
+        return finish(False)
+    
+    # Coordination: repair the clashes between blocks of each component
+    for component in components:
+        clashing = clashing_variables({v: merged[v] for v in component}, meta)
+        if not clashing:
+            continue
+        for fixed in (True, False):
+            run_stats = {}
+            if fixed:
+                assign = repair_search(component, domains, meta, merged, clashing, time_limit=remaining(),
+                                       stats=run_stats, **options_for(component))
+            else:
+                print(f"[csp] Repair: re-solving the whole component of {len(component)} variables")
+                assign = forward_checking_search(component, domains, meta, time_limit=remaining(), stats=run_stats,
+                                                 **options_for(component))
+            stats['backtrack_calls'] += run_stats['backtrack_calls']
+            stats['repairs'] += run_stats.get('repairs', 1)
+            if assign is not None:
+                merged.update(assign)
+                break
+            if run_stats['stopped']:
+                stats['stopped'] = run_stats['stopped']
+                merged.update(run_stats['best_partial'])
+                return finish(False)
+        else:
+            return finish(False)  # even the whole component has no solution
+    return finish(True)
+
+
+# Last complete timetable of an upload directory, kept for incremental re-solves
+LAST_TIMETABLE_FILE = 'last_timetable.json'
+
+
+def value_encoder(catalog, instructors_df=None):
+    """
+    Function (day, start, end, instructor, room) -> encoded value, or None
+    where one of them is not in catalog. Every part is matched as a string;
+    with instructors_df, an instructor may also be given by Name.
+    """
+    slots = {tuple(map(str, t)): k for k, t in enumerate(catalog.timeslots)}
+    instructors = {str(x): k for k, x in enumerate(catalog.instructors)}
+    if instructors_df is not None and 'InstructorID' in instructors_df.columns and 'Name' in instructors_df.columns:
+        for instructor_id, name in zip(instructors_df['InstructorID'], instructors_df['Name']):
+            if instructor_id in catalog.instructor_ids:
+                instructors.setdefault(str(name), catalog.instructor_ids[instructor_id])
+    rooms = {str(x): k for k, x in enumerate(catalog.rooms)}
+
+    def encode(day, start, end, instructor, room):
+        value = (slots.get((day, start, end)), instructors.get(instructor), rooms.get(room))
+        return None if None in value else value
+    return encode
+
+
+def save_last_timetable(path, assignment, catalog, digests):
+    """Store assignment by timeslot, instructor and room value (not ID) with the input digests"""
+    timetable = {}
+    for var, (slot, instructor, room) in assignment.items():
+        day, start, end = catalog.timeslots[slot]
+        timetable[var] = [str(day), str(start), str(end), str(catalog.instructors[instructor]), str(catalog.rooms[room])]
+    with open(path, 'w') as f:
+        json.dump({'inputs': digests, 'timetable': timetable}, f)
+
+
+def load_last_timetable(path, catalog):
+    """
+    The timetable stored by save_last_timetable, re-encoded against catalog:
+    returns (inputs digests, {var: value or None}), None where a timeslot,
+    instructor or room no longer exists; or (None, None) without a file.
+    """
+    try:
+        with open(path) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        return None, None
+    encode = value_encoder(catalog)
+    previous = {var: encode(*row) for var, row in saved['timetable'].items()}
+    return saved['inputs'], previous
+
+
+def incremental_search(variables, domains, meta, previous, time_limit=None, stats=None, **options):
+    """
+    Re-solve after an input change, staying close to the previous timetable.
+
+    previous maps variables to their old values (see load_last_timetable).
+    Variables that are new, whose old value left their domain, or that
+    clash with the values kept are re-solved by repair_search around the
+    rest, widening to their conflict neighbourhood if needed. Returns the
+    assignment, or None when no timetable near the previous one exists;
+    stats also receives 'kept' (old values left in place) and 'changed'.
+    """
+    stats = {} if stats is None else stats
+    kept = {v: previous[v] for v in variables if previous.get(v) is not None and previous[v] in domains[v]}
+    for v in clashing_variables(kept, meta):
+        del kept[v]
+    freed = [v for v in variables if v not in kept]
+    print(f"[csp] Incremental: {len(kept)} of {len(variables)} previous assignments still valid, re-solving {len(freed)}")
+    assign = repair_search(variables, domains, meta, kept, freed, time_limit=time_limit, stats=stats, **options)
+    if assign is not None:
+        stats['kept'] = sum(1 for v in variables if previous.get(v) == assign[v])
+        stats['changed'] = len(variables) - stats['kept']
+        print(f"[csp] Incremental: {stats['changed']} assignments changed")
+    return assign
+
+
+# Solver engines selectable in generate_timetable_from_uploads
+ENGINES = ('backtracking', 'local_search', 'ilp')
+
+
+def local_search(variables, domains, meta, max_steps=50000, time_limit=None, tabu_tenure=10, noise=0.05, seed=0,
+                 stats=None):
+    """
+    Min-conflicts local search with a tabu list, as an alternative to
+    forward_checking_search for large instances.
+
+    Starts from a greedy assignment (smallest domains first, each taking its
+    least conflicting value) and then repeatedly moves a conflicting variable
+    to its least conflicting value, never back to a slot it left within
+    tabu_tenure steps unless that beats the best assignment seen; with
+    probability noise the move goes to a random value instead. Usage counts
+    per (slot, instructor), (slot, room) and (slot, section) make a value's
+    conflict count a constant-time lookup, and a slot's best value is its
+    section cost plus its cheapest instructor and cheapest room.
+
+    Returns a conflict-free assignment in the same format as
+    forward_checking_search, or None when max_steps or time_limit runs out
+    (it cannot prove that no timetable exists). stats then reports
+    'stopped', and the best assignment seen minus its conflicting variables
+    as 'best_partial' with 'unassigned'.
+    """
+    rng = random.Random(seed)
+    stats = {} if stats is None else stats
+    stats.update(steps=0, conflicts=0, best_conflicts=0)
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    
+    # Candidates per variable: [(slot, instructors usable there)], rooms
+    candidates = {}
+    for v in variables:
+        dom = domains[v]
+        slots = [(t, dom.instructors_at(pos).tolist()) for pos, t in enumerate(dom.slots.tolist())]
+        candidates[v] = ([(t, instrs) for t, instrs in slots if instrs], dom.rooms.tolist())
+    searchable = [v for v in variables if candidates[v][0] and candidates[v][1]]
+    
+    # users[key] - variables whose current value uses the key, one key per
+    # ('i', slot, instructor), ('r', slot, room) and ('s', slot, section)
+    users = defaultdict(set)
+    clashes = dict.fromkeys(searchable, 0)  # other variables sharing a key with v
+    conflicted = []  # variables with clashes, with positions for O(1) removal
+    position = {}
+    assignment = {}
+    total = 0  # clashing pairs
+    
+    def keys(var, val):
+        ts, instr, room = val
+        return [('i', ts, instr), ('r', ts, room)] + [('s', ts, section) for section in meta[var]['sections']]
+    
+    def mark(var):
+        if clashes[var] and var not in position:
+            position[var] = len(conflicted)
+            conflicted.append(var)
+        elif not clashes[var] and var in position:
+            last = conflicted.pop()
+            k = position.pop(var)
+            if last != var:
+                conflicted[k] = last
+                position[last] = k
+    
+    def place(var, val, step):
+        """Add (step=1) or remove (step=-1) var's value from the usage counts"""
+        nonlocal total
+        for key in keys(var, val):
+            holders = users[key]
+            if step < 0:
+                holders.discard(var)
+            for other in holders:
+                clashes[other] += step
+                clashes[var] += step
+                total += step
+                mark(other)
+            if step > 0:
+                holders.add(var)
+        mark(var)
+    
+    def best_values(var):
+        """Cheapest value per slot as [(cost, slot, instructor, room)], ignoring var's own usage"""
+        current = assignment.get(var)
+        options = []
+        slots, rooms = candidates[var]
+        sections = meta[var]['sections']
+        for ts, instrs in slots:
+            own = current is not None and current[SLOT] == ts
+            cost = sum(len(users.get(('s', ts, s), ())) for s in sections) - (len(sections) if own else 0)
+            best_i = min(instrs, key=lambda i: (len(users.get(('i', ts, i), ())) - (own and current[INSTRUCTOR] == i), rng.random()))
+            best_r = min(rooms, key=lambda r: (len(users.get(('r', ts, r), ())) - (own and current[ROOM] == r), rng.random()))
+            cost += len(users.get(('i', ts, best_i), ())) - (own and current[INSTRUCTOR] == best_i)
+            cost += len(users.get(('r', ts, best_r), ())) - (own and current[ROOM] == best_r)
+            options.append((cost, ts, best_i, best_r))
+        return options
+    
+    def move(var, val):
+        if var in assignment:
+            place(var, assignment[var], -1)
+        assignment[var] = val
+        place(var, val, 1)
+    
+    # Greedy start: most constrained variables pick first
+    for var in sorted(searchable, key=lambda v: len(domains[v])):
+        cost, ts, instr, room = min(best_values(var), key=lambda o: (o[0], rng.random()))
+        move(var, (ts, instr, room))
+    print(f"[csp] Local search: greedy start has {total} conflicts over {len(searchable)} variables")
+    
+    best = dict(assignment)
+    best_total = total
+    tabu = {}  # (var, slot) -> step until which var may not move back to slot
+    stopped = None
+    step = 0
+    while conflicted:
+        if step >= max_steps:
+            stopped = 'step_limit'
+            break
+        if deadline is not None and not step & 63 and time.monotonic() >= deadline:
+            stopped = 'time_limit'
+            break
+        step += 1
+        var = conflicted[rng.randrange(len(conflicted))]
+        old = assignment[var]
+        if rng.random() < noise:
+            ts, instrs = rng.choice(candidates[var][0])
+            val = (ts, rng.choice(instrs), rng.choice(candidates[var][1]))
+        else:
+            own_cost = clashes[var]
+            allowed = [o for o in best_values(var)
+                       if tabu.get((var, o[1]), 0) < step or total - own_cost + o[0] < best_total]
+            if not allowed:
+                continue
+            cost, ts, instr, room = min(allowed, key=lambda o: (o[0], rng.random()))
+            val = (ts, instr, room)
+        if val == old:
+            continue
+        tabu[(var, old[SLOT])] = step + tabu_tenure
+        move(var, val)
+        if total < best_total:
+            best = dict(assignment)
+            best_total = total
+    
+    stats.update(steps=step, conflicts=total, best_conflicts=best_total, stopped=stopped)
+    complete = not conflicted and len(assignment) == len(variables)
+    print(f"[csp] Local search complete: steps={step}, conflicts={total}, best_conflicts={best_total}"
+          + (f", stopped by {stopped}" if stopped else ""))
+    if complete:
+        stats.update(best_partial=assignment, unassigned=[])
+        return assignment
+    
+    # Best partial: drop the most conflicting variables of the best assignment
+    # until what is left is conflict-free
+    for var, val in assignment.items():
+        place(var, val, -1)
+    assignment.clear()
+    for var, val in best.items():
+        move(var, val)
+    while conflicted:
+        var = max(conflicted, key=lambda v: clashes[v])
+        place(var, assignment.pop(var), -1)
+    stats.update(best_partial=assignment, unassigned=[v for v in variables if v not in assignment])
+    if stopped is None:
+        stats['stopped'] = 'unassignable'  # some variable has no candidate value at all
+    return None
+
+
+
+# Columns of a timetable, also when nothing could be assigned
+TIMETABLE_COLUMNS = ['CourseID', 'CourseName', 'SectionID', 'Session', 'Day', 'StartTime', 'EndTime', 'Room', 'Instructor']
+
 
 # ✅ Updated Function - handles course-group assignments and replicates to sections in each group
-def assignments_to_dataframe(assign, meta=None, courses_df=None, instructors_df=None, course_to_section_groups=None):
+def assignments_to_dataframe(assign, meta=None, courses_df=None, instructors_df=None, course_to_section_groups=None, catalog=None):
+    # With a catalog, assignment values are encoded (slot, instructor, room) IDs
     # Map CourseID -> CourseName if available
     course_name_map = {}
     if courses_df is not None and 'CourseID' in courses_df.columns and 'CourseName' in courses_df.columns:
@@ -638,9 +2465,15 @@ def assignments_to_dataframe(assign, meta=None, courses_df=None, instructors_df=
                 sections = ['Unknown']
             
             # Create a row for EACH section in this group
-            day, start, end = val['timeslot']
+            if catalog is not None:
+                day, start, end = catalog.timeslots[val[SLOT]]
+                instructor_id = catalog.instructors[val[INSTRUCTOR]]
+                room = catalog.rooms[val[ROOM]]
+            else:
+                day, start, end = val['timeslot']
+                instructor_id = val['instructor']
+                room = val['room']
             course_name = course_name_map.get(course, course)
-            instructor_id = val['instructor']
             instructor_name = instructor_name_map.get(str(instructor_id), instructor_id)
             
             for section in sections:
@@ -652,28 +2485,217 @@ def assignments_to_dataframe(assign, meta=None, courses_df=None, instructors_df=
                     'Day': day,
                     'StartTime': start,
                     'EndTime': end,
-                    'Room': val['room'],
+                    'Room': room,
                     'Instructor': instructor_name
                 })
         else:
             # Old format or unexpected format - try to handle gracefully
             print(f"Warning: Unexpected variable format: {var}")
     
-    return pd.DataFrame(rows)
+    return pd.DataFrame(rows, columns=TIMETABLE_COLUMNS)
+
+
+def timetable_hints(rows, variables, meta, catalog, instructors_df=None):
+    """
+    Turn timetable rows back into {var: value} hints for the search.
+
+    rows is a DataFrame in the format of assignments_to_dataframe, or the
+    path of a CSV or Excel file of such rows. Each row is matched to a
+    variable by CourseID, Session and SectionID; its Instructor may be the
+    name written by assignments_to_dataframe (given instructors_df) or the
+    ID. Rows whose variable, timeslot, instructor or room no longer exists
+    are skipped, as are variables whose rows disagree.
+    """
+    if isinstance(rows, str):
+        rows = pd.read_excel(rows) if rows.lower().endswith(('.xlsx', '.xls')) else pd.read_csv(rows)
+    by_section = {}
+    for v in variables:
+        course, _, session = v.split('::')
+        for section in meta[v]['sections']:
+            by_section[(course, session, str(section))] = v
+    encode = value_encoder(catalog, instructors_df)
+
+    hints = {}
+    disagree = set()
+    columns = ('CourseID', 'Session', 'SectionID', 'Day', 'StartTime', 'EndTime', 'Instructor', 'Room')
+    for course, session, section, day, start, end, instructor, room in zip(*(rows[c].astype(str) for c in columns)):
+        var = by_section.get((course, session, section))
+        value = encode(day, start, end, instructor, room)
+        if var is None or value is None:
+            continue
+        if hints.setdefault(var, value) != value:
+            disagree.add(var)
+    for var in disagree:
+        del hints[var]
+    print(f"[csp] Hints: {len(hints)} of {len(variables)} variables hinted by {len(rows)} timetable rows")
+    return hints
+
+
+def generate_timetable_from_uploads(upload_dir, propagation='fc', pigeonhole=False, time_limit=None, node_limit=None,
+                                    workers=1, restarts=None, engine='backtracking', improve=False, decompose=False,
+                                    incremental=False, hints=None, model_cache=True,
+                                    solution_cache=SOLUTION_CACHE_BYTES):
+    """
+    engine='backtracking' (the default) runs forward_checking_search;
+    propagation ('fc' or 'ac3') and pigeonhole select how much it propagates
+    after each assignment, and restarts ('luby' or 'geometric') its restart
+    schedule. With workers > 1, a portfolio of search variants races on that
+    many processes (see portfolio_search). With decompose, independent
+    year/department blocks are solved separately, on `workers` processes,
+    and their clashes repaired (see decomposed_search).
+
+    engine='local_search' runs the min-conflicts/tabu local_search instead,
+    with node_limit as its step limit. It cannot prove that no timetable
+    exists, so when it stops short the best partial timetable is returned.
+    engine='ilp' minimises the soft-constraint cost of scoring (the one in
+    df.attrs['score']) exactly with PuLP or OR-Tools when installed, falling
+    back to the built-in search.
+
+    time_limit (seconds, for the whole call) and node_limit (per search) bound
+    the solver. When a budget runs out before a timetable is found, the
+    largest partial timetable reached is returned instead (empty if the
+    budget ran out before anything was assigned), with
+    df.attrs['partial'] set and df.attrs['unassigned'] and
+    df.attrs['diagnostics'] describing what is missing.
 
+    df.attrs['score'] holds the soft-constraint cost breakdown of the
+    timetable (see scoring.Scorer.breakdown); with improve, a hill climber
+    first lowers that cost in whatever time is left.
 
+    With incremental, every complete timetable is saved to
+    LAST_TIMETABLE_FILE in upload_dir, and the next call starts from it:
+    only the variables the input change affects (plus their conflict
+    neighbourhood, if needed) are re-solved, the rest keep their old values
+    (see incremental_search). It solves from scratch when that fails.
+    df.attrs['changed'] then counts the assignments that differ.
 
-def generate_timetable_from_uploads(upload_dir):
-    courses_df, instructors_df, rooms_df, timeslots_df, sections_df = load_csvs(upload_dir)
-    variables, domains, meta, course_to_section_groups = build_domains(courses_df, instructors_df, rooms_df, timeslots_df, sections_df)
-    assign = forward_checking_search(variables, domains, meta)
+    hints, an existing timetable as rows of assignments_to_dataframe (or
+    the path of a CSV/Excel file of them), makes the backtracking search
+    try those values first (see timetable_hints); df.attrs['hints_kept']
+    counts the hinted course groups that kept their value.
+
+    model_cache reuses the parsed and encoded inputs of an earlier call on
+    the same files (see load_model).
+
+    Complete timetables are kept in SOLUTION_CACHE_DIR in upload_dir, keyed
+    by the input files and every option above, and a call repeating both
+    returns the stored DataFrame without solving, with df.attrs['cached']
+    set. solution_cache is the size of that cache in bytes (0 or None
+    disables it); least recently used timetables are evicted first.
+    df.attrs['solution_key'] names the cache entry. Incremental calls skip
+    the cache, since their result also depends on the last timetable.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}; expected one of {ENGINES}")
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    
+    def remaining():
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+    
+    search_options = dict(propagation=propagation, pigeonhole=pigeonhole, node_limit=node_limit, restarts=restarts)
+    digests = input_digests(upload_dir)
+    solution_dir = os.path.join(upload_dir, SOLUTION_CACHE_DIR)
+    key = None
+    if solution_cache and not incremental:
+        key = solution_key(digests, dict(search_options, time_limit=time_limit, workers=workers, engine=engine,
+                                         improve=improve, decompose=decompose, hints=hints_digest(hints)))
+        data = cache_read(solution_dir, key + '.pkl')
+        if data is not None:
+            try:
+                df = pickle.loads(data)
+                if not isinstance(df, pd.DataFrame):
+                    raise TypeError(f'expected a DataFrame, got {type(df).__name__}')
+            except Exception as e:
+                # Truncated, corrupt or from another pandas: solve again and replace it
+                print(f'[csp] Solution cache: ignoring unreadable {key}.pkl: {e}')
+                with contextlib.suppress(OSError):
+                    os.remove(os.path.join(solution_dir, key + '.pkl'))
+            else:
+                df.attrs['cached'] = True
+                print('[csp] Solution cache: returning the stored timetable for the same inputs and options')
+                return df
+    
+    variables, domains, meta, course_to_section_groups, frames = load_model(upload_dir, cache=model_cache)
+    courses_df, instructors_df, rooms_df, timeslots_df, sections_df = frames.values()
+    
+    if hints is not None:
+        hints = timetable_hints(hints, variables, meta, domains.catalog, instructors_df)
+        search_options['hints'] = hints
+    
+    last_path = os.path.join(upload_dir, LAST_TIMETABLE_FILE)
+    previous = None
+    if incremental:
+        inputs, previous = load_last_timetable(last_path, domains.catalog)
+        if inputs is not None:
+            changed = [name for name, digest in digests.items() if inputs.get(name) != digest]
+            print(f"[csp] Incremental: inputs changed since the last timetable: {', '.join(changed) or 'none'}")
+    
+    def search(domains, meta, stats):
+        if previous:
+            assign = incremental_search(variables, domains, meta, previous, time_limit=remaining(), stats=stats, **search_options)
+            if assign is not None or stats['stopped']:
+                return assign
+            print('[csp] Incremental: no timetable close to the last one; solving from scratch')
+            stats.clear()
+        if engine == 'ilp':
+            import model_builder
+            scorer = scoring.scorer_for(domains, meta, rooms_df, sections_df, timeslots_df=timeslots_df)
+            return model_builder.solve(variables, domains, meta, time_limit=remaining(), scorer=scorer, stats=stats,
+                                       **search_options)
+        if engine == 'local_search':
+            steps = dict(max_steps=node_limit) if node_limit is not None else {}
+            return local_search(variables, domains, meta, time_limit=remaining(), stats=stats, **steps)
+        if decompose:
+            return decomposed_search(variables, domains, meta, workers=workers, time_limit=remaining(), stats=stats, **search_options)
+        if workers > 1:
+            return portfolio_search(variables, domains, meta, workers=workers, time_limit=remaining(), stats=stats, **search_options)
+        return forward_checking_search(variables, domains, meta, time_limit=remaining(), stats=stats, **search_options)
+    
+    def timetable(assign, domains, meta, complete=True):
+        """DataFrame of assign, scored and optionally improved"""
+        scorer = scoring.scorer_for(domains, meta, rooms_df, sections_df, assign, timeslots_df=timeslots_df)
+        if improve:
+            scoring.improve(domains, scorer, time_limit=remaining())
+        df = assignments_to_dataframe(scorer.assignment, meta=meta, courses_df=courses_df, instructors_df=instructors_df, course_to_section_groups=course_to_section_groups, catalog=domains.catalog)
+        df.attrs['score'] = scorer.breakdown()
+        if hints:
+            df.attrs['hints_kept'] = sum(1 for v, val in hints.items() if scorer.assignment.get(v) == val)
+        if previous is not None:
+            df.attrs['changed'] = sum(1 for v, val in scorer.assignment.items() if previous.get(v) != val)
+        if incremental and complete:
+            save_last_timetable(last_path, scorer.assignment, domains.catalog, digests)
+        if key and complete:
+            df.attrs['solution_key'] = key
+            cache_write(solution_dir, key + '.pkl', pickle.dumps(df, protocol=pickle.HIGHEST_PROTOCOL), solution_cache)
+        return df
+    
+    def partial_timetable(stats, domains, meta, diag_lines):
+        """Timetable of the best partial assignment of a search stopped by its budget"""
+        partial = stats['best_partial']
+        unassigned = stats['unassigned']
+        work = f"{stats['steps']} steps" if 'steps' in stats else f"{stats['backtrack_calls']} nodes"
+        diag_lines.append(f"Search stopped by {stats['stopped']} after {work}: "
+                          f"{len(partial)}/{len(variables)} variables assigned")
+        diag_lines.append("Unassigned variables (first 20): " + ", ".join(unassigned[:20]))
+        for v in unassigned[:10]:
+            diag_lines.append(f"  {v}: domain size {len(domains[v])}, sections " + ", ".join(meta[v]['sections']))
+        diag = "\n".join(diag_lines)
+        print(f"[csp] Notice: returning a partial timetable ({len(unassigned)} variables unassigned)")
+        df = timetable(partial, domains, meta, complete=False)
+        df.attrs.update(partial=True, unassigned=unassigned, diagnostics=diag)
+        return df
+    
+    stats = {}
+    assign = search(domains, meta, stats)
+    if assign is None and stats['stopped']:
+        return partial_timetable(stats, domains, meta, ["No complete timetable found within the search budget."])
     if assign is None:
         total_vars = len(variables)
-        zero_domain = [v for v in variables if not domains.get(v)]
-        domain_sizes = sorted([(v, len(domains.get(v, []))) for v in variables], key=lambda x: x[1])
+        zero_domain = [v for v in variables if not len(domains[v])]
+        domain_sizes = sorted([(v, len(domains[v])) for v in variables], key=lambda x: x[1])
         sample = {}
         for v, sz in domain_sizes[:10]:
-            sample[v] = domains.get(v, [])[:5]
+            sample[v] = domains.decoded(v, limit=5)
         diag_lines = []
         diag_lines.append(f"No valid timetable found. variables={total_vars}, zero_domain_count={len(zero_domain)}")
         if zero_domain:
@@ -694,19 +2716,25 @@ def generate_timetable_from_uploads(upload_dir):
             fb = meta.get(v, {}).get('fallbacks', [])
             if fb:
                 diag_lines.append(f"  {v}: " + ", ".join(fb))
+        stats2 = {}
         try:
-            variables2, domains2, meta2, course_to_section_groups2 = build_domains(courses_df, instructors_df, rooms_df, timeslots_df, sections_df, force_permissive=True)
-            assign2 = forward_checking_search(variables2, domains2, meta2)
+            # The permissive domains are views of the already tagged candidates
+            domains2, fallbacks2 = domains.relaxed(force_permissive=True)
+            meta2 = {v: dict(meta[v], fallbacks=fallbacks2.get(v, [])) for v in variables}
+            assign2 = search(domains2, meta2, stats2)
             if assign2 is not None:
                 print('[csp] Notice: strict generation failed; permissive generation succeeded')
-                return assignments_to_dataframe(assign2, meta=meta2, courses_df=courses_df, instructors_df=instructors_df, course_to_section_groups=course_to_section_groups2)
+                return timetable(assign2, domains2, meta2)
+            elif stats2['stopped']:
+                diag_lines.append('\nPermissive generation (ignore qualifications and room-type) ran out of its search budget.')
             else:
                 diag_lines.append('\nAttempted permissive generation (ignore qualifications and room-type) but it also failed.')
         except Exception as e:
             diag_lines.append(f"\nAttempted permissive generation and it raised an error: {e}")
+        if stats2.get('stopped'):
+            return partial_timetable(stats2, domains2, meta2, diag_lines)
 
         diag = "\n".join(diag_lines)
         raise RuntimeError(diag)
 
-    df = assignments_to_dataframe(assign, meta=meta, courses_df=courses_df, instructors_df=instructors_df, course_to_section_groups=course_to_section_groups)
-    return df
+    return timetable(assign, domains, meta)
@@ -0,0 +1,309 @@
+"""
+Exact optimisation backend for the timetable CSP.
+
+build_model turns the output of csp.build_domains into a 0/1 integer
+program: hard section / instructor / room constraints plus the soft
+objective of scoring.Scorer, with the same constraints and weights, so the
+cost the solver minimises is the one Score_Breakdown.txt and
+scoring.improve report. solve runs it on PuLP/CBC or OR-Tools CP-SAT when
+one is installed and falls back to the built-in search otherwise.
+"""
+import time
+
+import csp
+import scoring
+
+try:
+    import pulp
+except ImportError:
+    pulp = None
+
+try:
+    from ortools.sat.python import cp_model
+except ImportError:
+    cp_model = None
+
+
+# CP-SAT only takes integer objective costs: they are scaled by this and rounded
+COST_SCALE = 600
+
+BACKENDS = ('auto', 'pulp', 'ortools', 'builtin')
+
+
+class IlpModel:
+    """
+    Solver-neutral integer program: columns with bounds and objective
+    costs, and linear constraints over column indexes.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.bounds = []
+        self.costs = []
+        self.constraints = []  # (name, {column: coefficient}, sense '<=' / '=' / '>=', rhs)
+
+    def column(self, name, upper=1, cost=0):
+        self.names.append(name)
+        self.bounds.append((0, upper))
+        self.costs.append(cost)
+        return len(self.names) - 1
+
+    def add(self, name, coeffs, sense, rhs):
+        self.constraints.append((name, coeffs, sense, rhs))
+
+    def write_lp(self, path):
+        """Write the model in CPLEX LP format, readable by CBC, HiGHS, Gurobi, ..."""
+        def terms(coeffs):
+            return ' '.join(f"{'+' if c >= 0 else '-'} {abs(c)} {self.names[k]}" for k, c in coeffs.items()) or '0 dummy'
+        with open(path, 'w') as f:
+            f.write('Minimize\n obj: ' + terms({k: c for k, c in enumerate(self.costs) if c}) + '\n')
+            f.write('Subject To\n')
+            for name, coeffs, sense, rhs in self.constraints:
+                f.write(f" {name}: {terms(coeffs)} {sense} {rhs}\n")
+            f.write('Bounds\n')
+            for name, (lower, upper) in zip(self.names, self.bounds):
+                if upper != 1:
+                    f.write(f" {lower} <= {name} <= {upper}\n")
+            binaries = [n for n, (_, upper) in zip(self.names, self.bounds) if upper == 1]
+            general = [n for n, (_, upper) in zip(self.names, self.bounds) if upper != 1]
+            if binaries:
+                f.write('Binaries\n ' + ' '.join(binaries) + '\n')
+            if general:
+                f.write('Generals\n ' + ' '.join(general) + '\n')
+            f.write('End\n')
+
+
+def build_model(variables, domains, meta, scorer=None, soft_preferences=True):
+    """
+    Build the 0/1 program for the given variables and encoded domains.
+
+    A value (slot, instructor, room) is not given a column of its own:
+    instructor and room only interact through the slot, so the model keeps
+    the domains factored, with
+        s[v,t] = 1        v meets at slot t          (sum over t = 1)
+        y[v,t,i] = 1      v is taught by i at t      (sum over i = s[v,t])
+        w[v,t,r] = 1      v is held in room r at t   (sum over r = s[v,t])
+    which is equivalent to one column per value but linear in the factor
+    sizes. With soft_preferences, instructor PreferredSlots become an
+    objective cost instead of removing the (slot, instructor) pairs.
+
+    The objective is the total cost of scorer (a scoring.Scorer, e.g. from
+    scoring.scorer_for), whose weights, class sizes, room seats and slot
+    times it uses; without one, every class fits every room. Each soft
+    constraint of scoring is encoded exactly:
+        preferred_slots   cost on y[v,t,i] when i is unavailable on t's day
+        room_capacity     cost on w[v,t,r] per student of v beyond r's seats
+        instructor_days   z[i,d] >= every y of i on day d, cost per z
+        section_gaps      g[t1,t2] >= x[t1] + x[t2] - 1 - x[blockers], for
+                          each section and day, x[t] being the section's
+                          class at t: the idle time from t1 to t2 counts
+                          when t1 is the class ending last before t2 starts
+    Slots whose times are unreadable never count towards gaps, as in the
+    Scorer.
+
+    Returns (model, columns) where columns maps ('s', v, t), ('y', v, t, i)
+    and ('w', v, t, r) to column indexes, or (None, None) when a variable
+    has an empty domain.
+    """
+    catalog = domains.catalog
+    scorer = scorer or scoring.Scorer(meta, catalog)
+    # objective cost per raw amount (minute, day, student, class) of each soft constraint
+    unit_cost = {c: w / scoring.UNITS[c][1] for c, w in scorer.weights.items()}
+    model = IlpModel()
+    columns = {}
+    instructor_rows = {}  # (t, i) -> {column: 1}
+    room_rows = {}
+    section_rows = {}
+    section_day_slots = {}  # (section, day) -> {t: None}, in insertion order
+    instructor_day_rows = {}  # (i, day) -> {column: 1}
+
+    for n, v in enumerate(variables):
+        dom = domains[v]
+        if not len(dom) and not (soft_preferences and len(dom.slots) and len(dom.instructors) and len(dom.rooms)):
+            return None, None
+        one_slot = {}
+        for pos, t in enumerate(dom.slots.tolist()):
+            usable = dom.instructors.tolist() if soft_preferences else dom.instructors_at(pos).tolist()
+            if not usable:
+                continue
+            day = int(catalog.slot_days[t])
+            s = columns[('s', v, t)] = model.column(f"s_{n}_{t}")
+            one_slot[s] = 1
+            by_instructor = {s: -1}
+            for i in usable:
+                cost = unit_cost['preferred_slots'] if catalog.unavailable[i, day] else 0
+                y = columns[('y', v, t, i)] = model.column(f"y_{n}_{t}_{i}", cost=cost)
+                by_instructor[y] = 1
+                instructor_rows.setdefault((t, i), {})[y] = 1
+                instructor_day_rows.setdefault((i, day), {})[y] = 1
+            model.add(f"instr_{n}_{t}", by_instructor, '=', 0)
+            by_room = {s: -1}
+            for r in dom.rooms.tolist():
+                cost = unit_cost['room_capacity'] * scorer.overflow(v, r)
+                w = columns[('w', v, t, r)] = model.column(f"w_{n}_{t}_{r}", cost=cost)
+                by_room[w] = 1
+                room_rows.setdefault((t, r), {})[w] = 1
+            model.add(f"room_{n}_{t}", by_room, '=', 0)
+            for section in meta[v]['sections']:
+                section_rows.setdefault((t, section), {})[s] = 1
+                section_day_slots.setdefault((section, day), {})[t] = None
+        model.add(f"assign_{n}", one_slot, '=', 1)
+
+    # Hard: one class per instructor, room and section at a time
+    for kind, rows in (('iclash', instructor_rows), ('rclash', room_rows), ('sclash', section_rows)):
+        for k, coeffs in enumerate(rows.values()):
+            if len(coeffs) > 1:
+                model.add(f"{kind}_{k}", coeffs, '<=', 1)
+
+    # Soft: days an instructor is on campus; z >= every class of the instructor that day
+    if unit_cost['instructor_days']:
+        for (i, day), coeffs in instructor_day_rows.items():
+            z = model.column(f"z_{i}_{day}", cost=unit_cost['instructor_days'])
+            model.add(f"days_{i}_{day}", {**coeffs, z: -len(coeffs)}, '<=', 0)
+
+    # Soft: idle time between the classes of a section on a day
+    if unit_cost['section_gaps']:
+        for k, ((section, day), slots) in enumerate(section_day_slots.items()):
+            add_gap_rows(model, f"{k}", section, slots, section_rows, scorer.slot_times, unit_cost['section_gaps'])
+
+    print(f"[model] Built 0/1 model: {len(model.names)} columns, {len(model.constraints)} constraints")
+    return model, columns
+
+
+def add_gap_rows(model, name, section, slots, section_rows, slot_times, cost_per_minute):
+    """
+    Gap columns of one section on one day, following Scorer.idle_minutes:
+    classes sorted by (start, end), the idle time before a class is measured
+    from the latest end among the classes before it. So the pair t1 < t2
+    costs start2 - end1 exactly when both are held and no other held class
+    before t2 ends after t1 (ties broken by the sort key).
+    """
+    timed = sorted((slot_times[t] + (t,) for t in slots if slot_times[t] is not None))
+    for b, (start2, end2, t2) in enumerate(timed):
+        for a, (start1, end1, t1) in enumerate(timed[:b]):
+            idle = start2 - end1
+            if idle <= scoring.GAP_GRACE_MINUTES:
+                continue
+            blockers = [t for k, (_, end, t) in enumerate(timed[:b]) if k != a and (end, k) > (end1, a)]
+            g = model.column(f"g_{name}_{t1}_{t2}", cost=cost_per_minute * idle)
+            coeffs = {g: -1}
+            for t, sign in [(t1, 1), (t2, 1)] + [(t, -1) for t in blockers]:
+                for column in section_rows[(t, section)]:
+                    coeffs[column] = sign
+            model.add(f"gap_{name}_{t1}_{t2}", coeffs, '<=', 1)
+
+
+def solve_pulp(model, time_limit=None):
+    """Solve with PuLP's bundled CBC; returns column values or None"""
+    started = time.monotonic()
+    problem = pulp.LpProblem('timetable', pulp.LpMinimize)
+    cols = [pulp.LpVariable(name, lowBound=lower, upBound=upper, cat='Integer')
+            for name, (lower, upper) in zip(model.names, model.bounds)]
+    problem += pulp.lpSum(c * cols[k] for k, c in enumerate(model.costs) if c)
+    for name, coeffs, sense, rhs in model.constraints:
+        expr = pulp.lpSum(c * cols[k] for k, c in coeffs.items())
+        if sense == '<=':
+            problem += (expr <= rhs, name)
+        elif sense == '>=':
+            problem += (expr >= rhs, name)
+        else:
+            problem += (expr == rhs, name)
+    if time_limit is not None:
+        # translating the model counts against the limit too
+        time_limit = time_limit - (time.monotonic() - started)
+        if time_limit <= 0:
+            return None
+    problem.solve(pulp.PULP_CBC_CMD(msg=False, timeLimit=time_limit))
+    if problem.sol_status not in (pulp.LpSolutionOptimal, pulp.LpSolutionIntegerFeasible):
+        return None
+    return [round(c.varValue or 0) for c in cols]
+
+
+def solve_ortools(model, time_limit=None):
+    """Solve with OR-Tools CP-SAT; returns column values or None"""
+    started = time.monotonic()
+    m = cp_model.CpModel()
+    cols = [m.NewIntVar(lower, upper, name) for name, (lower, upper) in zip(model.names, model.bounds)]
+    def linear(coeffs):
+        return cp_model.LinearExpr.weighted_sum([cols[k] for k in coeffs], list(coeffs.values()))
+    for name, coeffs, sense, rhs in model.constraints:
+        expr = linear(coeffs)
+        if sense == '<=':
+            m.Add(expr <= rhs)
+        elif sense == '>=':
+            m.Add(expr >= rhs)
+        else:
+            m.Add(expr == rhs)
+    m.Minimize(linear({k: round(c * COST_SCALE) for k, c in enumerate(model.costs) if c}))
+    solver = cp_model.CpSolver()
+    if time_limit is not None:
+        time_limit = time_limit - (time.monotonic() - started)
+        if time_limit <= 0:
+            return None
+        solver.parameters.max_time_in_seconds = time_limit
+    status = solver.Solve(m)
+    if status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        return None
+    return [solver.Value(c) for c in cols]
+
+
+def available_backends():
+    """Installed exact backends, in order of preference"""
+    return [name for name, module in (('ortools', cp_model), ('pulp', pulp)) if module is not None]
+
+
+def solve(variables, domains, meta, backend='auto', time_limit=None, scorer=None, soft_preferences=True,
+          stats=None, **search_options):
+    """
+    Optimise the timetable with an exact backend.
+
+    backend 'auto' takes the first of available_backends(), 'pulp' and
+    'ortools' insist on that one, and 'builtin' (also the fallback when
+    nothing is installed or the backend finds no solution in time) runs
+    csp.forward_checking_search with search_options, which only looks for a
+    feasible timetable. scorer defines the objective (see build_model).
+    Returns an assignment in the usual
+    {var: (slot, instructor, room)} format, or None.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}; expected one of {BACKENDS}")
+    stats = {} if stats is None else stats
+    if backend == 'auto':
+        installed = available_backends()
+        backend = installed[0] if installed else 'builtin'
+    elif backend in ('pulp', 'ortools') and backend not in available_backends():
+        print(f"[model] {backend} is not installed; using the built-in solver")
+        backend = 'builtin'
+
+    if backend != 'builtin':
+        started = time.monotonic()
+        model, columns = build_model(variables, domains, meta, scorer=scorer, soft_preferences=soft_preferences)
+        values = None
+        remaining = None if time_limit is None else max(0.0, time_limit - (time.monotonic() - started))
+        if model is not None and remaining == 0:
+            print(f"[model] Building the model used up the time limit; {backend} not run")
+        elif model is not None:
+            values = (solve_ortools if backend == 'ortools' else solve_pulp)(model, remaining)
+            if values is None:
+                print(f"[model] {backend} found no solution in time")
+        if values is not None:
+            assignment = decode(columns, values)
+            objective = sum(c * values[k] for k, c in enumerate(model.costs) if c)
+            stats.update(backend=backend, objective=objective, stopped=None, best_partial=assignment, unassigned=[])
+            print(f"[model] {backend} solution with objective {objective}")
+            return assignment
+        print("[model] Using the built-in solver")
+        if time_limit is not None:
+            time_limit = max(0.0, time_limit - (time.monotonic() - started))
+
+    stats['backend'] = 'builtin'
+    return csp.forward_checking_search(variables, domains, meta, time_limit=time_limit, stats=stats, **search_options)
+
+
+def decode(columns, values):
+    """Read the chosen slot, instructor and room of every variable off the column values"""
+    chosen = {}
+    for key, k in columns.items():
+        if values[k]:
+            chosen.setdefault(key[1], {})[key[0]] = key[2:]
+    return {v: (parts['s'][0], parts['y'][1], parts['w'][1]) for v, parts in chosen.items()}
@@ -0,0 +1,136 @@
+"""
+Column schema of the five input files.
+
+Every input declares the columns it must have and the dtypes of the
+columns it may have: identifiers and free text are strings, Day, Type and
+Role are categoricals, and numbers are floats so that missing values stay
+NaN. Timeslots also get StartMinutes / EndMinutes, their times parsed to
+minutes since midnight.
+
+read_input reads and validates one CSV with these dtypes, using the
+pyarrow engine when it is installed. save_frame stores the validated frame
+next to its CSV (Feather with pyarrow, a pickle without), and load_input
+returns that stored frame while it is newer than the CSV, so generation
+does not parse text again.
+"""
+import os
+import re
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    CSV_ENGINE = 'pyarrow'
+    FRAME_SUFFIX = '.feather'
+except ImportError:
+    CSV_ENGINE = 'c'
+    FRAME_SUFFIX = '.pkl'
+
+
+# name -> (required columns, dtype of each known column)
+SCHEMAS = {
+    'courses': (
+        ('CourseID', 'Type'),
+        {'CourseID': str, 'CourseName': str, 'Credits': 'float64', 'Type': 'category', 'Year': 'float64',
+         'Shared': str},
+    ),
+    'instructors': (
+        (),
+        {'InstructorID': str, 'Name': str, 'Role': 'category', 'PreferredSlots': str, 'QualifiedCourses': str},
+    ),
+    'rooms': (
+        ('RoomID', 'Type'),
+        {'RoomID': str, 'Type': 'category', 'Capacity': 'float64'},
+    ),
+    'timeslots': (
+        ('Day', 'StartTime', 'EndTime'),
+        {'Day': 'category', 'StartTime': str, 'EndTime': str, 'Duration': 'float64'},
+    ),
+    'sections': (
+        ('SectionID',),
+        {'SectionID': str, 'CourseID': str, 'Capacity': 'float64'},
+    ),
+}
+
+# '9:00 AM', '9:00am', '9 AM', 24-hour '21:00' or '9', each with optional
+# seconds ('09:00:00', as spreadsheets export them); the one time format of
+# every input
+TIME_PATTERN = re.compile(r'^\s*(\d{1,2})(?::(\d{2})(?::(\d{2}))?)?\s*([AaPp][Mm])?\s*$')
+
+
+def clock_minutes(text):
+    """A TIME_PATTERN time -> minutes since midnight (seconds dropped); None if unreadable"""
+    match = TIME_PATTERN.match(str(text))
+    if match is None:
+        return None
+    hours, minutes, seconds = (int(g or 0) for g in match.group(1, 2, 3))
+    period = (match.group(4) or '').upper()
+    if minutes > 59 or seconds > 59 or (not 1 <= hours <= 12 if period else hours > 23):
+        return None
+    if period:
+        hours = hours % 12 + (12 if period == 'PM' else 0)
+    return hours * 60 + minutes
+
+
+def parse_minutes(times):
+    """Series of times -> minutes since midnight (NaN where unreadable)"""
+    return pd.to_numeric(times.map(clock_minutes, na_action='ignore'), errors='coerce')
+
+
+def validate(name, df):
+    """
+    Check df against the schema of input `name` and finish its typing.
+
+    Raises ValueError naming the missing columns or the unreadable times;
+    returns df with categoricals applied and, for timeslots, the minute
+    columns added.
+    """
+    required, dtypes = SCHEMAS[name]
+    missing = set(required) - set(df.columns)
+    if missing:
+        raise ValueError(f"Missing required columns for {name}: {', '.join(sorted(missing))}")
+    for column, dtype in dtypes.items():
+        if dtype == 'category' and column in df.columns:
+            df[column] = df[column].astype('category')
+    if name == 'timeslots':
+        for column, minutes in (('StartTime', 'StartMinutes'), ('EndTime', 'EndMinutes')):
+            df[minutes] = parse_minutes(df[column])
+            bad = df[column][df[minutes].isna()]
+            if len(bad):
+                raise ValueError(f"Invalid {column} in timeslots: {bad.iloc[0]!r} (expected e.g. '9:00 AM', '21:00' or '09:00:00')")
+    return df
+
+
+def read_input(path, name):
+    """Read the CSV of input `name` with its declared dtypes and validate it"""
+    _, dtypes = SCHEMAS[name]
+    try:
+        df = pd.read_csv(path, engine=CSV_ENGINE,
+                         dtype={column: dtype for column, dtype in dtypes.items() if dtype != 'category'})
+    except (ValueError, UnicodeDecodeError, pd.errors.ParserError) as e:
+        raise ValueError(f'Invalid CSV format for {name}: {e}') from e
+    return validate(name, df)
+
+
+def frame_path(csv_path):
+    return os.path.splitext(csv_path)[0] + FRAME_SUFFIX
+
+
+def save_frame(df, csv_path):
+    """Store the validated frame read from csv_path next to it"""
+    path = frame_path(csv_path)
+    if FRAME_SUFFIX == '.feather':
+        df.reset_index(drop=True).to_feather(path)
+    else:
+        df.to_pickle(path)
+
+
+def load_input(csv_path, name):
+    """The validated frame of input `name`: stored by save_frame if still current, else read from csv_path"""
+    path = frame_path(csv_path)
+    try:
+        if os.path.getmtime(path) >= os.path.getmtime(csv_path):
+            return pd.read_feather(path) if FRAME_SUFFIX == '.feather' else pd.read_pickle(path)
+    except OSError:
+        pass
+    return read_input(csv_path, name)
@@ -0,0 +1,287 @@
+"""
+Soft-constraint scoring of timetables.
+
+Costs are kept per row, a row being one section's day, one instructor or
+one room, so a Scorer re-scores only the rows a move touches:
+
+    section_gaps     idle time between two classes of a section on a day
+    instructor_days  days an instructor has to be on campus
+    room_capacity    students of a class beyond the seats of its room
+    preferred_slots  classes an instructor teaches on a "Not on" day
+
+Assignments are the usual {var: (slot, instructor, room)} ID tuples of
+csp.build_domains. improve() is a small hill climber on top of the Scorer
+that only makes moves keeping the timetable free of clashes.
+"""
+import random
+import time
+from collections import Counter, defaultdict
+
+import pandas as pd
+
+import schema
+
+
+# Weight of each soft constraint, per unit of UNITS
+SCORE_WEIGHTS = {
+    'section_gaps': 1,
+    'instructor_days': 2,
+    'room_capacity': 1,
+    'preferred_slots': 5,
+}
+
+# (unit, raw amounts per unit) of each constraint; gaps are counted in minutes
+UNITS = {
+    'section_gaps': ('idle hours', 60),
+    'instructor_days': ('days on campus', 1),
+    'room_capacity': ('students over capacity', 1),
+    'preferred_slots': ('classes on a "Not on" day', 1),
+}
+
+# Idle time up to this many minutes is a break between slots, not a gap
+GAP_GRACE_MINUTES = 15
+
+
+def _slot_time(start, end):
+    """(start, end) minutes of a timeslot, None if either time is unreadable"""
+    start, end = schema.clock_minutes(start), schema.clock_minutes(end)
+    return None if start is None or end is None else (start, end)
+
+
+class Scorer:
+    """
+    Incremental soft-constraint cost of one (possibly partial) assignment.
+
+    move(var, val) re-scores the rows of var's old and new value only and
+    returns the change in total cost; delta(var, val) is the same change
+    without keeping the move.
+    """
+
+    def __init__(self, meta, catalog, section_sizes=None, room_capacity=None, weights=None, slot_minutes=None):
+        self.weights = dict(SCORE_WEIGHTS, **(weights or {}))
+        self.meta = meta
+        self.slot_days = catalog.slot_days.tolist()
+        # slot -> (start, end) minutes, or None for a slot whose times are
+        # unreadable; it then never counts towards gaps
+        if slot_minutes is None:
+            slot_minutes = [_slot_time(start, end) for _, start, end in catalog.timeslots]
+        self.slot_times = slot_minutes
+        self.unavailable = catalog.unavailable
+        section_sizes = section_sizes or {}
+        self.students = {v: sum(section_sizes.get(s, 0) for s in m['sections']) for v, m in meta.items()}
+        self.room_capacity = room_capacity or {}  # room ID -> seats; rooms not listed never overflow
+        self.assignment = {}
+        self.section_slots = defaultdict(list)     # (section, day) -> slots of its classes
+        self.instructor_days = defaultdict(Counter)  # instructor -> day -> classes
+        self.room_vars = defaultdict(set)          # room -> vars held there
+        self.rows = {}  # row key -> {constraint: raw amount}
+        self.totals = dict.fromkeys(self.weights, 0)
+
+    def rows_of(self, var, val):
+        """Row keys whose cost depends on var taking val"""
+        slot, instructor, room = val
+        day = self.slot_days[slot]
+        return [('section', s, day) for s in self.meta[var]['sections']] + [('instructor', instructor), ('room', room)]
+
+    def overflow(self, var, room):
+        return max(0, self.students.get(var, 0) - self.room_capacity.get(room, float('inf')))
+
+    def row_amounts(self, key):
+        kind = key[0]
+        if kind == 'section':
+            return {'section_gaps': self.idle_minutes(self.section_slots.get(key[1:], ()))}
+        if kind == 'instructor':
+            days = self.instructor_days.get(key[1], {})
+            return {
+                'instructor_days': sum(1 for n in days.values() if n),
+                'preferred_slots': sum(n for d, n in days.items() if self.unavailable[key[1], d]),
+            }
+        return {'room_capacity': sum(self.overflow(v, key[1]) for v in self.room_vars.get(key[1], ()))}
+
+    def idle_minutes(self, slots):
+        idle = 0
+        end = None
+        for start, finish in sorted(self.slot_times[t] for t in slots if self.slot_times[t] is not None):
+            if end is not None and start - end > GAP_GRACE_MINUTES:
+                idle += start - end
+            end = finish if end is None else max(end, finish)
+        return idle
+
+    def cost(self, amounts):
+        return sum(self.weights[c] * n / UNITS[c][1] for c, n in amounts.items())
+
+    def move(self, var, val):
+        """Give var the value val (None unassigns it); returns the change in total cost"""
+        old = self.assignment.get(var)
+        keys = set()
+        if old is not None:
+            keys.update(self.rows_of(var, old))
+        if val is not None:
+            keys.update(self.rows_of(var, val))
+        before = 0
+        for key in keys:
+            amounts = self.rows.pop(key, {})
+            before += self.cost(amounts)
+            for c, n in amounts.items():
+                self.totals[c] -= n
+
+        if old is not None:
+            slot, instructor, room = old
+            day = self.slot_days[slot]
+            for s in self.meta[var]['sections']:
+                self.section_slots[(s, day)].remove(slot)
+            self.instructor_days[instructor][day] -= 1
+            self.room_vars[room].discard(var)
+            del self.assignment[var]
+        if val is not None:
+            slot, instructor, room = val
+            day = self.slot_days[slot]
+            for s in self.meta[var]['sections']:
+                self.section_slots[(s, day)].append(slot)
+            self.instructor_days[instructor][day] += 1
+            self.room_vars[room].add(var)
+            self.assignment[var] = val
+
+        after = 0
+        for key in keys:
+            amounts = self.rows[key] = self.row_amounts(key)
+            after += self.cost(amounts)
+            for c, n in amounts.items():
+                self.totals[c] += n
+        return after - before
+
+    def delta(self, var, val):
+        """Change in total cost if var took val, leaving the assignment as it is"""
+        old = self.assignment.get(var)
+        change = self.move(var, val)
+        self.move(var, old)
+        return change
+
+    def total(self):
+        return self.cost(self.totals)
+
+    def breakdown(self):
+        """constraint -> {'amount', 'unit', 'weight', 'cost'}, plus the 'total' cost"""
+        report = {}
+        for c, n in self.totals.items():
+            unit, per = UNITS[c]
+            report[c] = {'amount': n / per, 'unit': unit, 'weight': self.weights[c],
+                         'cost': self.weights[c] * n / per}
+        report['total'] = self.total()
+        return report
+
+
+def scorer_for(domains, meta, rooms_df=None, sections_df=None, assignment=None, weights=None, timeslots_df=None):
+    """
+    Scorer for csp.build_domains output, with class sizes from the Capacity
+    column of sections.csv and room seats from that of rooms.csv (when
+    present), and slot times from the StartMinutes/EndMinutes columns that
+    schema.validate adds to timeslots.csv, loaded with assignment.
+    """
+    catalog = domains.catalog
+    slot_minutes = None
+    if timeslots_df is not None and 'StartMinutes' in timeslots_df.columns:
+        times = {}
+        for day, start, end, m0, m1 in zip(timeslots_df['Day'], timeslots_df['StartTime'], timeslots_df['EndTime'],
+                                           timeslots_df['StartMinutes'], timeslots_df['EndMinutes']):
+            if pd.notna(m0) and pd.notna(m1):
+                times[(day, start, end)] = (int(m0), int(m1))
+        slot_minutes = [times.get(t) or _slot_time(t[1], t[2]) for t in catalog.timeslots]
+    section_sizes = {}
+    if sections_df is not None and 'Capacity' in sections_df.columns:
+        sizes = pd.to_numeric(sections_df['Capacity'], errors='coerce').fillna(0)
+        section_sizes = dict(zip(sections_df['SectionID'].astype(str), sizes.astype(int)))
+    room_capacity = {}
+    if rooms_df is not None and 'Capacity' in rooms_df.columns:
+        seats = pd.to_numeric(rooms_df['Capacity'], errors='coerce')
+        for room, n in zip(rooms_df['RoomID'], seats):
+            if pd.notna(n):
+                r = catalog.room_ids[room]
+                room_capacity[r] = max(room_capacity.get(r, 0), int(n))
+    scorer = Scorer(meta, catalog, section_sizes, room_capacity, weights, slot_minutes)
+    for var, val in (assignment or {}).items():
+        scorer.move(var, val)
+    return scorer
+
+
+def improve(domains, scorer, time_limit=None, sample=200, max_passes=20, seed=0, stats=None):
+    """
+    Hill-climb the assignment held by scorer.
+
+    Each pass tries, for every assigned variable, up to `sample` random
+    values of its domain that clash with no other class, and moves it to the
+    one lowering the cost most. Stops after a pass without improvement,
+    max_passes, or time_limit seconds. Returns the cost saved.
+    """
+    stats = {} if stats is None else stats
+    started = time.monotonic()
+    rng = random.Random(seed)
+    assignment = scorer.assignment
+    instructors = Counter((t, i) for t, i, _ in assignment.values())
+    rooms = Counter((t, r) for t, _, r in assignment.values())
+    sections = Counter((t, s) for v, (t, _, _) in assignment.items() for s in scorer.meta[v]['sections'])
+    saved = 0
+    moves = 0
+    passes = 0
+    stopped = None
+    while passes < max_passes and stopped is None:
+        passes += 1
+        improved = False
+        for var in list(assignment):
+            if time_limit is not None and time.monotonic() - started > time_limit:
+                stopped = 'time_limit'
+                break
+            dom = domains[var]
+            if not len(dom):
+                continue
+            current = assignment[var]
+            t0, i0, r0 = current
+            own = scorer.meta[var]['sections']
+            best, best_delta = None, 0
+            for _ in range(sample):
+                pos = rng.randrange(len(dom.slots))
+                usable = dom.instructors_at(pos)
+                if not len(usable):
+                    continue
+                t = int(dom.slots[pos])
+                i = int(usable[rng.randrange(len(usable))])
+                r = int(dom.rooms[rng.randrange(len(dom.rooms))])
+                if (t, i, r) == current:
+                    continue
+                if instructors[(t, i)] - ((t, i) == (t0, i0)) or rooms[(t, r)] - ((t, r) == (t0, r0)):
+                    continue
+                if t != t0 and any(sections[(t, s)] for s in own):
+                    continue
+                change = scorer.delta(var, (t, i, r))
+                if change < best_delta - 1e-9:
+                    best, best_delta = (t, i, r), change
+            if best is None:
+                continue
+            t, i, r = best
+            instructors[(t0, i0)] -= 1
+            rooms[(t0, r0)] -= 1
+            instructors[(t, i)] += 1
+            rooms[(t, r)] += 1
+            for s in own:
+                sections[(t0, s)] -= 1
+                sections[(t, s)] += 1
+            saved -= scorer.move(var, best)
+            moves += 1
+            improved = True
+        if not improved:
+            break
+    stats.update(passes=passes, moves=moves, saved=saved, stopped=stopped)
+    print(f"[score] Improvement: {moves} moves in {passes} passes saved {saved:.1f} (cost now {scorer.total():.1f})")
+    return saved
+
+
+def format_breakdown(breakdown):
+    """Plain-text report of Scorer.breakdown()"""
+    lines = ['Soft-constraint cost breakdown (lower is better)', '']
+    for c, row in breakdown.items():
+        if c == 'total':
+            continue
+        lines.append(f"{c:16} {row['amount']:8.1f} {row['unit']:28} x {row['weight']:<3} = {row['cost']:8.1f}")
+    lines.append('')
+    lines.append(f"{'total':16} {breakdown['total']:.1f}")
+    return "\n".join(lines) + "\n"
@@ -8,6 +8,8 @@ from io import BytesIO
 import pandas as pd
 import xlsxwriter
 import csp
+import schema
+import scoring
 import traceback
 import zipfile
 
@@ -32,13 +34,25 @@ UPLOAD_BASE = _init_upload_base()
 
 ALLOWED_TARGETS = ('courses', 'instructors', 'rooms', 'timeslots', 'sections')
 ALLOWED_EXTENSIONS = {'.csv'}
-REQUIRED_COLUMNS = {
-    'courses': {'CourseID', 'Type'},
-    'instructors': set(),
-    'rooms': {'RoomID', 'Type'},
-    'timeslots': {'Day', 'StartTime', 'EndTime'},
-    'sections': {'SectionID'},
-}
+
+# Solver budget per generation; keep it below gunicorn's worker timeout so a
+# hard input yields a partial timetable instead of a killed worker
+SEARCH_TIME_LIMIT = float(os.getenv('SEARCH_TIME_LIMIT', '240'))
+# Processes racing search variants per generation (1 = single search)
+SEARCH_WORKERS = int(os.getenv('SEARCH_WORKERS', '1'))
+# Restart schedule of the search ('luby', 'geometric'; empty, the default, for none)
+SEARCH_RESTARTS = os.getenv('SEARCH_RESTARTS', '').strip() or None
+# Solver engine: 'backtracking', 'local_search' or 'ilp'
+SEARCH_ENGINE = os.getenv('SEARCH_ENGINE', 'backtracking')
+# Solve independent year/department blocks separately ('1' to enable)
+SEARCH_DECOMPOSE = os.getenv('SEARCH_DECOMPOSE', '0') == '1'
+# Re-solve from the last timetable, changing as little as possible ('1' to enable)
+SEARCH_INCREMENTAL = os.getenv('SEARCH_INCREMENTAL', '0') == '1'
+# Spend the rest of the budget lowering the soft-constraint cost ('1' to enable)
+SEARCH_IMPROVE = os.getenv('SEARCH_IMPROVE', '0') == '1'
+# Disk space for timetables and zips of earlier generations, reused for
+# identical inputs and options (0 to disable)
+SOLUTION_CACHE_BYTES = int(float(os.getenv('SOLUTION_CACHE_MB', '64')) * 1024 * 1024)
 
 # Store generated zip temporarily
 last_generated_zip = None
@@ -53,23 +67,6 @@ def _allowed_file_extension(filename):
     return ext.lower() in ALLOWED_EXTENSIONS
 
 
-def _validate_required_columns(target, filepath):
-    required = REQUIRED_COLUMNS.get(target, set())
-    if not required:
-        return None
-
-    try:
-        columns = set(pd.read_csv(filepath, nrows=0).columns)
-    except Exception:
-        return f'Invalid CSV format for {target}'
-
-    missing = required - columns
-    if missing:
-        missing_cols = ', '.join(sorted(missing))
-        return f'Missing required columns for {target}: {missing_cols}'
-    return None
-
-
 def _save_uploaded_csv(file_storage, target, forced_filename=None):
     original_name = secure_filename(file_storage.filename or '')
     if not original_name:
@@ -86,10 +83,16 @@ def _save_uploaded_csv(file_storage, target, forced_filename=None):
     save_path = os.path.join(target_dir, filename)
     file_storage.save(save_path)
 
-    validation_error = _validate_required_columns(target, save_path)
-    if validation_error:
-        os.remove(save_path)
-        raise ValueError(validation_error)
+    # Validate once, here; generation then loads the typed frame instead of the CSV
+    try:
+        frame = schema.read_input(save_path, target)
+    except ValueError:
+        for path in (save_path, schema.frame_path(save_path)):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    if filename == f'{target}.csv':
+        schema.save_frame(frame, save_path)
 
     return filename, save_path
 
@@ -237,20 +240,11 @@ def create_excel_timetable(df, title="Timetable"):
     
     # Time sorting
     def time_to_minutes(time_str):
-        try:
-            # Remove any extra spaces
-            time_str = time_str.strip()
-            # Handle formats like "9:00", "9:0", "09:00", "1:15", etc.
-            if ':' in time_str:
-                parts = time_str.split(':')
-                hours = int(parts[0])
-                minutes = int(parts[1]) if len(parts) > 1 and parts[1] else 0
-                return hours * 60 + minutes
-            # If no colon, assume it's just hours
-            return int(time_str) * 60
-        except Exception as e:
-            print(f"Error parsing time '{time_str}': {e}")
+        minutes = schema.clock_minutes(time_str)
+        if minutes is None:
+            print(f"Error parsing time '{time_str}'")
             return 0
+        return minutes
     
     def parse_timeslot(timeslot):
         try:
@@ -475,33 +469,11 @@ def create_excel_timetable(df, title="Timetable"):
     output.seek(0)
     return output
 
-@app.route('/generate', methods=['POST'])
-def generate():
-    global last_generated_zip
-    
-    # Track generation time
-    start_time = time.time()
-    
-    # Reset the zip file
-    last_generated_zip = None
-    
-    # Generate timetable using uploaded CSVs in static/uploads
-    try:
-        upload_dir = os.path.join(UPLOAD_BASE)
-        df = csp.generate_timetable_from_uploads(upload_dir)
-        generation_time = time.time() - start_time
-        
-        # Log timing to console
-        print(f"\n{'='*60}")
-        print(f"Timetable Generation Complete!")
-        print(f"Time taken: {generation_time:.2f} seconds")
-        print(f"Total assignments: {len(df)}")
-        print(f"{'='*60}\n")
-        
-    except Exception as e:
-        # Log full traceback to server console for debugging
-        traceback.print_exc()
-        return jsonify(success=False, message=str(e)), 500
+def _timetable_zip(df):
+    """Zip of the main, year, instructor and room timetables of df; returns (bytes, file count)"""
+    partial = bool(df.attrs.get('partial'))
+    diagnostics = df.attrs.get('diagnostics', '')
+    score = df.attrs.get('score')
 
     # Sort by day of week and time
     day_order = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
@@ -509,16 +481,8 @@ def generate():
     
     def time_to_minutes(time_str):
         """Convert time string like '9:00 AM' to minutes since midnight for sorting"""
-        try:
-            time_part, period = time_str.strip().split()
-            hours, minutes = map(int, time_part.split(':'))
-            if period == 'PM' and hours != 12:
-                hours += 12
-            elif period == 'AM' and hours == 12:
-                hours = 0
-            return hours * 60 + minutes
-        except:
-            return 9999
+        minutes = schema.clock_minutes(time_str)
+        return 9999 if minutes is None else minutes
     
     df['TimeOrder'] = df['StartTime'].apply(time_to_minutes)
     df_sorted = df.sort_values(['DayOrder', 'TimeOrder', 'CourseID']).drop(['DayOrder', 'TimeOrder'], axis=1).reset_index(drop=True)
@@ -581,22 +545,92 @@ def generate():
                 zip_file.writestr(f'Rooms/{safe_name}.xlsx', room_excel.getvalue())
         
         print(f"[generate] Created {len(rooms)} room timetables")
+        
+        # 5. What a partial timetable is missing
+        if partial:
+            zip_file.writestr('Diagnostics.txt', diagnostics)
+        
+        # 6. Soft-constraint cost breakdown
+        if score:
+            zip_file.writestr('Score_Breakdown.txt', scoring.format_breakdown(score))
     
     zip_buffer.seek(0)
     
-    total_files = 1 + len(years) + len(instructors) + len(rooms)
+    total_files = 1 + len(years) + len(instructors) + len(rooms) + int(partial) + int(bool(score))
     print(f"[generate] Total files in zip: {total_files}")
+    return zip_buffer.getvalue(), total_files
+
+
+@app.route('/generate', methods=['POST'])
+def generate():
+    global last_generated_zip
+    
+    # Track generation time
+    start_time = time.time()
+    
+    # Reset the zip file
+    last_generated_zip = None
     
-    # Store the zip file globally for download
-    last_generated_zip = zip_buffer.read()
+    # Generate timetable using uploaded CSVs in static/uploads
+    try:
+        upload_dir = os.path.join(UPLOAD_BASE)
+        df = csp.generate_timetable_from_uploads(upload_dir, time_limit=SEARCH_TIME_LIMIT, workers=SEARCH_WORKERS,
+                                                 restarts=SEARCH_RESTARTS, engine=SEARCH_ENGINE,
+                                                 improve=SEARCH_IMPROVE, decompose=SEARCH_DECOMPOSE,
+                                                 incremental=SEARCH_INCREMENTAL, solution_cache=SOLUTION_CACHE_BYTES)
+        generation_time = time.time() - start_time
+        partial = bool(df.attrs.get('partial'))
+        unassigned = df.attrs.get('unassigned', [])
+        score = df.attrs.get('score')
+        changed = df.attrs.get('changed')
+        
+        # Log timing to console
+        print(f"\n{'='*60}")
+        print(f"Timetable Generation Complete!")
+        print(f"Time taken: {generation_time:.2f} seconds")
+        print(f"Total assignments: {len(df)}")
+        if partial:
+            print(f"Partial timetable: {len(unassigned)} course groups unassigned")
+        if score:
+            print(f"Soft-constraint cost: {score['total']:.1f}")
+        if changed is not None:
+            print(f"Assignments changed since the last timetable: {changed}")
+        if df.attrs.get('cached'):
+            print("Returned from the solution cache")
+        print(f"{'='*60}\n")
+        
+    except Exception as e:
+        # Log full traceback to server console for debugging
+        traceback.print_exc()
+        return jsonify(success=False, message=str(e)), 500
+
+    # Identical inputs and options: reuse the zip stored with the cached timetable
+    solution_dir = os.path.join(UPLOAD_BASE, csp.SOLUTION_CACHE_DIR)
+    zip_name = f"{df.attrs['solution_key']}.zip" if 'solution_key' in df.attrs else None
+    cached_zip = csp.cache_read(solution_dir, zip_name) if df.attrs.get('cached') else None
+    if cached_zip is not None:
+        print("[generate] Reusing the zip of the cached timetable")
+        last_generated_zip = cached_zip
+        total_files = len(zipfile.ZipFile(BytesIO(cached_zip)).namelist())
+    else:
+        last_generated_zip, total_files = _timetable_zip(df)
+        if zip_name and SOLUTION_CACHE_BYTES:
+            csp.cache_write(solution_dir, zip_name, last_generated_zip, SOLUTION_CACHE_BYTES)
 
     # Return JSON response for API
     return jsonify(
         success=True,
+        partial=partial,
+        unassigned=unassigned,
         total_assignments=len(df),
         total_files=total_files,
         generation_time=generation_time,
-        message='Timetables generated successfully'
+        score=score['total'] if score else None,
+        changed=changed,
+        cached=bool(df.attrs.get('cached')),
+        message=('Partial timetable generated: the search budget ran out with '
+                 f'{len(unassigned)} course groups unassigned (see Diagnostics.txt)') if partial
+                else 'Timetables generated successfully'
     )
 
 @app.route('/download', methods=['GET'])
@@ -0,0 +1,50 @@
+import os
+import sys
+
+import pytest
+
+# The modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# A small solvable set of the five inputs
+INPUTS = {
+    'courses.csv': (
+        'CourseID,CourseName,Credits,Type,Year,Shared\n'
+        'CSC101,Programming,3,Lecture and Lab,1,\n'
+        'MTH101,Calculus,3,Lecture and TUT,1,\n'
+    ),
+    'instructors.csv': (
+        'InstructorID,Name,Role,PreferredSlots,QualifiedCourses\n'
+        'I1,Dr. One,Professor,,"CSC101,MTH101"\n'
+        'I2,Dr. Two,Professor,Not on Monday,MTH101\n'
+        'I3,TA Three,Assistant Professor,,"CSC101,MTH101"\n'
+    ),
+    'rooms.csv': (
+        'RoomID,Type,Capacity\n'
+        'R1,Lecture,60\n'
+        'L1,Lab,30\n'
+        'T1,TUT,30\n'
+    ),
+    'timeslots.csv': (
+        'Day,StartTime,EndTime,Duration\n'
+        'Sunday,9:00 AM,10:30 AM,90\n'
+        'Sunday,10:45 AM,12:15 PM,90\n'
+        'Sunday,12:30 PM,2:00 PM,90\n'
+        'Monday,9:00 AM,10:30 AM,90\n'
+        'Monday,10:45 AM,12:15 PM,90\n'
+        'Monday,12:30 PM,2:00 PM,90\n'
+    ),
+    'sections.csv': (
+        'SectionID,Capacity\n'
+        '1/1,30\n'
+        '1/2,30\n'
+    ),
+}
+
+
+@pytest.fixture
+def upload_dir(tmp_path):
+    for name, text in INPUTS.items():
+        (tmp_path / name).write_text(text)
+    return str(tmp_path)
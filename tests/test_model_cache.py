@@ -0,0 +1,81 @@
+"""Model cache: round trips through save_model/read_model, rebuilt when stale or unreadable"""
+import os
+
+import csp
+
+
+def count_builds(monkeypatch):
+    builds = []
+    build_domains = csp.build_domains
+
+    def counting(*args, **kwargs):
+        builds.append(1)
+        return build_domains(*args, **kwargs)
+    monkeypatch.setattr(csp, 'build_domains', counting)
+    return builds
+
+
+def cached_models(upload_dir):
+    cache_dir = os.path.join(upload_dir, csp.MODEL_CACHE_DIR)
+    return sorted(name for name in os.listdir(cache_dir) if name.endswith('.model'))
+
+
+def test_model_round_trip(upload_dir, monkeypatch):
+    builds = count_builds(monkeypatch)
+    variables, domains, meta, groups, frames = csp.load_model(upload_dir, cache=False)
+    csp.load_model(upload_dir)
+    assert len(builds) == 2 and len(cached_models(upload_dir)) == 1
+
+    cached_variables, cached_domains, cached_meta, cached_groups, cached_frames = csp.load_model(upload_dir)
+    assert len(builds) == 2  # read back, not rebuilt
+    assert cached_variables == variables
+    assert cached_meta == meta
+    assert cached_groups == groups
+    assert list(cached_frames) == list(frames)
+    for name, df in frames.items():
+        assert cached_frames[name].equals(df), name
+    for v in variables:
+        assert cached_domains.decoded(v) == domains.decoded(v), v
+    assert (cached_domains.catalog.unavailable == domains.catalog.unavailable).all()
+    assert csp.forward_checking_search(cached_variables, cached_domains, cached_meta) == \
+        csp.forward_checking_search(variables, domains, meta)
+
+
+def test_model_rebuilt_after_input_change(upload_dir, monkeypatch):
+    builds = count_builds(monkeypatch)
+    csp.load_model(upload_dir)
+    with open(os.path.join(upload_dir, 'sections.csv'), 'a') as f:
+        f.write('1/3,30\n')
+    variables, domains, meta, _, _ = csp.load_model(upload_dir)
+    assert len(builds) == 2
+    assert any('1/3' in m['sections'] for m in meta.values())
+
+
+def test_stale_model_version_discarded(upload_dir, monkeypatch):
+    builds = count_builds(monkeypatch)
+    csp.load_model(upload_dir)
+    stale = cached_models(upload_dir)
+    monkeypatch.setattr(csp, 'MODEL_CACHE_VERSION', csp.MODEL_CACHE_VERSION + 1)
+    monkeypatch.setattr(csp, 'MODEL_CACHE_ENTRIES', 1)
+    csp.load_model(upload_dir)
+    assert len(builds) == 2  # the model of the old version is not read...
+    current = cached_models(upload_dir)
+    assert len(current) == 1 and current != stale  # ...and evicted as the least recently used
+    csp.load_model(upload_dir)
+    assert len(builds) == 2
+
+
+def test_unreadable_model_rebuilt(upload_dir, monkeypatch):
+    builds = count_builds(monkeypatch)
+    csp.load_model(upload_dir)
+    path = os.path.join(upload_dir, csp.MODEL_CACHE_DIR, cached_models(upload_dir)[0])
+    with open(path, 'rb') as f:
+        saved = f.read()
+    for junk in (b'', b'\x10\x00\x00\x00\x00\x00\x00\x00garbage', b'\xff' * 64, saved[:len(saved) - 16]):
+        with open(path, 'wb') as f:
+            f.write(junk)
+        variables, domains, meta, _, _ = csp.load_model(upload_dir)
+        assert variables and all(len(domains[v]) for v in variables)
+    assert len(builds) == 5
+    csp.load_model(upload_dir)
+    assert len(builds) == 5  # the rebuilt model replaced the unreadable one
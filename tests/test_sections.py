@@ -0,0 +1,92 @@
+"""match_sections against the per-pair rule it replaced"""
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import csp
+
+
+def can_assign_course_to_section(course_id, section_id, course_year, is_shared=False):
+    """The per course x section rule build_domains applied before match_sections"""
+    if not section_id or '/' not in str(section_id):
+        return True
+    parts = str(section_id).split('/')
+    section_right = parts[1].strip()
+    try:
+        section_year = int(parts[0].strip())
+    except ValueError:
+        return True
+    if course_year != section_year:
+        return False
+    if course_year in [1, 2]:
+        return True
+    if course_year == 3 and is_shared:
+        return section_right.upper() in ['AID', 'BIF', 'CSC', 'CNC']
+    if course_year in [3, 4]:
+        course_dept = course_id[:3].upper() if len(course_id) >= 3 else ""
+        return course_dept == section_right.upper()
+    return True
+
+
+def expected(course_years, shared, section_ids):
+    result = {}
+    for course, year in course_years.items():
+        matched = [s for s in section_ids
+                   if can_assign_course_to_section(course, s, year, shared.get(course, False) and year == 3)]
+        if matched:
+            result[course] = matched
+    return result
+
+
+def matched(course_years, shared, section_ids):
+    courses = pd.DataFrame({
+        'course': list(course_years),
+        'year': pd.Series(list(course_years.values()), dtype=object),
+        'shared': [shared.get(c, False) for c in course_years],
+    })
+    return csp.match_sections(courses, csp.parse_section_ids(pd.Series(section_ids, dtype=object)))
+
+
+SECTIONS = ['1/1', '1/2', '2/1', '2/2', '3/AID/1', '3/BIF/1', '3/CSC/1', '3/CNC/1', '3/MTH/1',
+            '4/AID/1', '4/CSC/1', '4/CNC/2']
+
+
+@pytest.mark.parametrize('course_years, shared', [
+    ({'CSC111': 1, 'MTH112': 2}, {}),
+    ({'AID321': 3, 'CSC301': 3, 'CNC401': 4, 'BIF410': 4}, {}),
+    ({'MTH301': 3, 'HUM302': 3}, {'MTH301': True}),
+    ({'CSC401': 4}, {'CSC401': True}),  # only year-3 courses are shared
+    ({'CSC111': 1.0, 'AID321': 3.0}, {}),
+])
+def test_years_and_shared_courses(course_years, shared):
+    assert matched(course_years, shared, SECTIONS) == expected(course_years, shared, SECTIONS)
+
+
+def test_shared_course_reaches_every_department():
+    sections = matched({'MTH301': 3}, {'MTH301': True}, SECTIONS)['MTH301']
+    assert sections == ['3/AID/1', '3/BIF/1', '3/CSC/1', '3/CNC/1']
+
+
+@pytest.mark.parametrize('section_ids', [
+    ['', '7', 'x/1', '/3', '3/', 'nan'],
+    [' 3 / cnc /1', ' 4/csc', '+3/CSC', '-1/2', '3.0/AID', '5/1'],
+])
+def test_malformed_section_ids(section_ids):
+    course_years = {'CSC111': 1, 'CNC301': 3, 'CSC401': 4, 'MTH501': 5, 'CN': 3}
+    shared = {'CNC301': True}
+    assert matched(course_years, shared, section_ids) == expected(course_years, shared, section_ids)
+
+
+def test_randomized_against_pairwise_rule():
+    rng = random.Random(0)
+    years = [1, 2, 3, 4, 5, 0, 3.0, np.nan, '3']
+    ids = ['CSC111', 'AID321', 'bif301', 'CN', 'CNC401', 'XYZ200', 'MTH101', 'ABC350']
+    pool = SECTIONS + ['3/bif', '4/XYZ/3', 'x/1', '3.0/AID', '', '7', '/3', '3/', '+3/CSC', ' 4/csc', '5/1']
+    for _ in range(100):
+        course_years = {c: rng.choice(years) for c in rng.sample(ids, rng.randint(1, len(ids)))}
+        shared = {c: rng.random() < 0.5 for c in course_years}
+        section_ids = [rng.choice(pool) for _ in range(rng.randint(0, 12))]
+        assert matched(course_years, shared, section_ids) == expected(course_years, shared, section_ids), \
+            (course_years, shared, section_ids)
@@ -0,0 +1,64 @@
+"""Solution cache: identical calls return the stored timetable, stale or unreadable entries are solved again"""
+import os
+import pickle
+
+import pandas as pd
+
+import csp
+
+
+def generate(upload_dir, **options):
+    return csp.generate_timetable_from_uploads(upload_dir, model_cache=False, **options)
+
+
+def stored(upload_dir):
+    cache_dir = os.path.join(upload_dir, csp.SOLUTION_CACHE_DIR)
+    return sorted(name for name in os.listdir(cache_dir) if name.endswith('.pkl'))
+
+
+def test_solution_round_trip(upload_dir):
+    solved = generate(upload_dir)
+    assert not solved.attrs.get('cached') and stored(upload_dir) == [solved.attrs['solution_key'] + '.pkl']
+    cached = generate(upload_dir)
+    assert cached.attrs['cached']
+    assert cached.equals(solved)
+    assert cached.attrs['score'] == solved.attrs['score']
+    assert cached.attrs['solution_key'] == solved.attrs['solution_key']
+
+
+def test_options_and_inputs_are_part_of_the_key(upload_dir):
+    generate(upload_dir)
+    assert not generate(upload_dir, improve=True).attrs.get('cached')
+    with open(os.path.join(upload_dir, 'rooms.csv'), 'a') as f:
+        f.write('R2,Lecture,60\n')
+    assert not generate(upload_dir).attrs.get('cached')
+    assert len(stored(upload_dir)) == 3
+
+
+def test_stale_solution_version_discarded(upload_dir, monkeypatch):
+    old = generate(upload_dir).attrs['solution_key']
+    monkeypatch.setattr(csp, 'SOLUTION_CACHE_VERSION', csp.SOLUTION_CACHE_VERSION + 1)
+    assert not generate(upload_dir).attrs.get('cached')
+    monkeypatch.setattr(pd, '__version__', pd.__version__ + '.other')
+    # keep room for one timetable only: the stale ones are evicted first
+    df = generate(upload_dir, solution_cache=1)
+    assert not df.attrs.get('cached')
+    assert stored(upload_dir) == [df.attrs['solution_key'] + '.pkl'] and df.attrs['solution_key'] != old
+
+
+def test_unreadable_solution_solved_again(upload_dir):
+    solved = generate(upload_dir)
+    path = os.path.join(upload_dir, csp.SOLUTION_CACHE_DIR, stored(upload_dir)[0])
+    with open(path, 'rb') as f:
+        saved = f.read()
+    for junk in (b'', b'garbage', saved[:len(saved) // 2], pickle.dumps(['not', 'a', 'frame'])):
+        with open(path, 'wb') as f:
+            f.write(junk)
+        df = generate(upload_dir)
+        assert not df.attrs.get('cached') and df.equals(solved)
+        assert generate(upload_dir).attrs['cached']  # stored again in place of the unreadable entry
+
+
+def test_incremental_calls_skip_the_cache(upload_dir):
+    generate(upload_dir)
+    assert not generate(upload_dir, incremental=True).attrs.get('cached')
@@ -0,0 +1,81 @@
+"""Symmetry breaking keeps every instance's answer: solvable or not"""
+import random
+
+import pandas as pd
+
+import csp
+import schema
+
+
+DAYS = ('Sunday', 'Monday', 'Tuesday')
+TIMES = (('9:00 AM', '10:30 AM'), ('10:45 AM', '12:15 PM'), ('12:30 PM', '2:00 PM'))
+
+
+def small_instance(seed):
+    """Five validated input frames of a random small year-1 timetable, often just (un)satisfiable"""
+    rng = random.Random(seed)
+    courses = [f'CSC1{k:02d}' for k in range(rng.randint(2, 4))]
+    slots = [(day, start, end, 90) for day in DAYS for start, end in TIMES]
+    rng.shuffle(slots)
+    frames = {
+        'courses': pd.DataFrame({
+            'CourseID': courses, 'CourseName': courses, 'Year': 1,
+            'Type': [rng.choice(['Lecture', 'Lecture and Lab', 'Lecture and TUT']) for _ in courses],
+        }),
+        'instructors': pd.DataFrame({
+            'InstructorID': ['I0', 'I1', 'I2', 'I3'], 'Name': ['N0', 'N1', 'N2', 'N3'],
+            'Role': ['Professor', 'Professor', 'Assistant Professor', 'Assistant Professor'],
+            'PreferredSlots': [rng.choice(['', 'Not on Monday']) for _ in range(4)],
+            'QualifiedCourses': [','.join(rng.sample(courses, rng.randint(1, len(courses)))) for _ in range(4)],
+        }),
+        # two pairs of identical rooms
+        'rooms': pd.DataFrame({'RoomID': ['R1', 'R2', 'L1', 'L2'], 'Type': ['Lecture', 'Lecture', 'Lab', 'Lab'],
+                               'Capacity': [60.0, 60.0, 30.0, 30.0]}),
+        'timeslots': pd.DataFrame(slots[:rng.randint(4, 9)], columns=['Day', 'StartTime', 'EndTime', 'Duration']),
+        'sections': pd.DataFrame({'SectionID': [f'1/{k}' for k in range(1, rng.randint(2, 7))], 'Capacity': 30.0}),
+    }
+    for name, df in frames.items():
+        for column in df.columns:
+            if df[column].dtype == object:
+                df[column] = df[column].astype(str)
+    return [schema.validate(name, df) for name, df in frames.items()]
+
+
+def assert_valid(variables, domains, meta, assignment):
+    assert set(assignment) == set(variables)
+    held = set()
+    for var, value in assignment.items():
+        assert value in domains[var]
+        slot, instructor, room = value
+        for key in [('instructor', slot, instructor), ('room', slot, room)] + \
+                   [('section', slot, s) for s in meta[var]['sections']]:
+            assert key not in held, (var, key)
+            held.add(key)
+
+
+def outcome(variables, domains, meta, symmetry):
+    stats = {}
+    assignment = csp.forward_checking_search(variables, domains, meta, symmetry=symmetry, node_limit=3000,
+                                             stats=stats)
+    if assignment is not None:
+        assert_valid(variables, domains, meta, assignment)
+        return 'sat'
+    return 'stopped' if stats['stopped'] else 'unsat'
+
+
+def test_symmetry_breaking_keeps_sat_and_unsat():
+    compared = {'sat': 0, 'unsat': 0}
+    for seed in range(40):
+        variables, domains, meta, _ = csp.build_domains(*small_instance(seed))
+        if not csp.group_symmetries(variables, domains, meta):
+            continue
+        with_symmetry = outcome(variables, domains, meta, True)
+        without = outcome(variables, domains, meta, False)
+        if 'stopped' in (with_symmetry, without):
+            assert {with_symmetry, without} != {'sat', 'unsat'}
+            continue
+        assert with_symmetry == without, seed
+        compared[with_symmetry] += 1
+    # the instances above must exercise both answers with symmetries to break
+    assert compared['sat'] >= 5 and compared['unsat'] >= 5, compared
+